@@ -43,10 +43,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'web_app.middleware.MemoryTrackingMiddleware',
+    'web_app.middleware.TemplateTimingMiddleware',
+    'web_app.middleware.PrecompressedStaticMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'web_app.middleware.ProfilerMiddleware',
+    'web_app.middleware.MetricsMiddleware',
+    'web_app.middleware.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -77,6 +83,14 @@ WSGI_APPLICATION = 'Przemyslane_Zakupy.wsgi.application'
 
 from .local_settings import DATABASES
 
+# Cache has to be shared by all worker processes: cached permissions, favourites and sentinel user id are
+# invalidated there. Shared cache (Redis or Memcached) is set as CACHES in local_settings. Default per-process
+# memory cache is fine for one process only, 'manage.py check' warns about it when DEBUG is off.
+try:
+    from .local_settings import CACHES
+except ImportError:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -97,6 +111,11 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+AUTHENTICATION_BACKENDS = [
+    'web_app.backends.CachedPermissionBackend',
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.0/topics/i18n/
 
@@ -114,9 +133,46 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Fingerprinted and precompressed files are served by web_app.middleware.PrecompressedStaticMiddleware
+# after collectstatic, runserver serves plain files in DEBUG mode.
+if not DEBUG:
+    STATICFILES_STORAGE = 'web_app.storage.CompressedManifestStaticFilesStorage'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = '/login/'
+
+# Profiles of requests made by staff users with '_profile' parameter
+PROFILE_DIR = BASE_DIR / 'profiles'
+
+# Memory used by each request is measured with tracemalloc when turned on, see 'memory_report' command
+MEMORY_TRACKING = False
+MEMORY_TRACKING_LOG = BASE_DIR / 'memory.log'
+
+# Calls and time of templates, filters and tags are sent in Server-Timing header when turned on
+TEMPLATE_TIMING = False
+
+# Metrics of all worker processes are shared through this directory, see /metrics
+METRICS_DIR = BASE_DIR / 'metrics'
+
+# Queries slower than this number of seconds are written with EXPLAIN plan to rotating SLOW_QUERY_LOG,
+# see 'slow_queries' command, None turns logging off
+SLOW_QUERY_THRESHOLD = None
+SLOW_QUERY_LOG = BASE_DIR / 'slow_queries.log'
+
+# Requests to these URL names are limited per user (or IP address for anonymous users) to 'burst' requests
+# refilled evenly over 'period' seconds, 'methods' limits only given HTTP methods
+RATE_LIMITS = {
+    'user_login': {'burst': 10, 'period': 60, 'methods': ('POST',)},
+    'user_create': {'burst': 5, 'period': 300, 'methods': ('POST',)},
+    'plan_meal_random_add': {'burst': 30, 'period': 60},
+    'plan_products': {'burst': 30, 'period': 60},
+}
+
+# Plans not opened for this number of days are moved to archive tables by 'archive_plans' command
+PLAN_ARCHIVE_DAYS = 365
@@ -40,14 +40,26 @@ urlpatterns = [
 
 
     path('', v.BaseView.as_view(), name='base_view'),
+    path('sw.js', v.ServiceWorkerView.as_view(), name='service_worker'),
+    path('changes/', v.ChangeFeedView.as_view(), name='changes'),
+    path('metrics', v.MetricsView.as_view(), name='metrics'),
+    path('autocomplete/<str:kind>', v.AutocompleteView.as_view(), name='autocomplete'),
+    path('jobs/<int:job_id>', v.JobStatusView.as_view(), name='job_status'),
+    path('profiles/<str:name>/', v.ProfileDetailsView.as_view(), name='profile_details'),
     path('plans/', v.PlanListView.as_view(), name='plans'),
     path('plans/<int:plan_id>/', v.PlanDetailsView.as_view(), name='plan_details'),
     path('plans/add/', v.PlanAddView.as_view(), name='plan_add'),
     path('plans/edit/<int:plan_id>/', v.PlanModifyView.as_view(), name='plan_modify'),
     path('plans/delete/<int:plan_id>/', v.PlanDeleteView.as_view(), name='plan_delete'),
+    path('plans/clone/<int:plan_id>/', v.PlanCloneView.as_view(), name='plan_clone'),
     path('plans/add-meal/<int:plan_id>', v.PlanMealAddView.as_view(), name='plan_meal_add'),
+    path('plans/add-meal/<int:plan_id>/delta', v.PlanMealDeltaView.as_view(), name='plan_meals_delta'),
     path('plans/add-meal-random/<int:plan_id>', v.PlanMealRandomAdd.as_view(), name='plan_meal_random_add'),
+    path('plans/product-list/', v.PlansProductListView.as_view(), name='plans_products'),
     path('plans/product-list/<int:plan_id>', v.PlanProductListView.as_view(), name='plan_products'),
+    path('plans/product-list/<int:plan_id>/bought/<int:product_id>', v.PlanBoughtProductView.as_view(),
+         name='plan_product_bought'),
+    path('plans/product-list/<int:plan_id>/sync', v.PlanProductListSyncView.as_view(), name='plan_products_sync'),
 
 
 
@@ -58,7 +70,9 @@ urlpatterns = [
     path('meals/edit/<int:meal_id>', v.MealModifyView.as_view(), name='meal_modify'),
     path('meals/delete/<int:meal_id>', v.MealDeleteView.as_view(), name='meal_delete'),
     path('meals/add-product/<int:meal_id>', v.MealProductAddView.as_view(), name='meal_product_add'),
+    path('meals/add-product/<int:meal_id>/delta', v.MealProductDeltaView.as_view(), name='meal_products_delta'),
     path('meals/add-plan/<int:meal_id>', v.MealPlanAddView.as_view(), name='meal_plan_add'),
+    path('meals/set-grams/<int:meal_id>', v.MealProductGramsBulkSet.as_view(), name='meal_grams_bulk'),
     path('meals/set-grams/<int:meal_id>/<int:product_id>', v.MealProductGramsSet.as_view(), name='meal_grams'),
 
 
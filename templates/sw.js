@@ -0,0 +1,43 @@
+{% load static %}const CACHE_NAME = 'przemyslane-zakupy-v1';
+const STATIC_FILES = ['{% static "js/script.js" %}', '{% static "js/product_list.js" %}'];
+
+self.addEventListener('install', function(event) {
+    event.waitUntil(caches.open(CACHE_NAME).then(function(cache) {
+        return cache.addAll(STATIC_FILES);
+    }));
+    self.skipWaiting();
+})
+
+self.addEventListener('activate', function(event) {
+    event.waitUntil(caches.keys().then(function(names) {
+        return Promise.all(names.filter(function(name) {
+            return name !== CACHE_NAME;
+        }).map(function(name) {
+            return caches.delete(name);
+        }));
+    }));
+    self.clients.claim();
+})
+
+self.addEventListener('fetch', function(event) {
+    const url = new URL(event.request.url);
+    if (event.request.method !== 'GET' || url.pathname.endsWith('/sync')) {
+        return;
+    }
+    if (url.pathname.startsWith('/plans/product-list/')) {
+        // Shopping list page: network first, cached copy when offline.
+        event.respondWith(fetch(event.request).then(function(response) {
+            const copy = response.clone();
+            caches.open(CACHE_NAME).then(function(cache) {
+                cache.put(event.request, copy);
+            });
+            return response;
+        }).catch(function() {
+            return caches.match(event.request);
+        }));
+    } else if (url.pathname.startsWith('{% get_static_prefix %}')) {
+        event.respondWith(caches.match(event.request).then(function(cached) {
+            return cached || fetch(event.request);
+        }));
+    }
+})
@@ -10,4 +10,9 @@ admin.site.register(m.MealProduct)
 admin.site.register(m.PlanMeal)
 admin.site.register(m.SelectedPlan)
 admin.site.register(m.FavouritePlan)
-admin.site.register(m.FavouriteMeal)
\ No newline at end of file
+admin.site.register(m.FavouriteMeal)
+admin.site.register(m.SimilarMeal)
+admin.site.register(m.PlanBoughtProduct)
+admin.site.register(m.ChangeLog)
+admin.site.register(m.Job)
+admin.site.register(m.ArchivedPlan)
\ No newline at end of file
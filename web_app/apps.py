@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class WebAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'web_app'
+
+    def ready(self):
+        from web_app import checks  # noqa: F401
+        from web_app import signals  # noqa: F401
@@ -0,0 +1,113 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import Http404
+from django.utils import timezone
+
+from web_app import changes
+from web_app import models as m
+
+# Plans unused for PLAN_ARCHIVE_DAYS are moved with their meals to ArchivedPlan and ArchivedPlanMeal tables,
+# so Plan and PlanMeal tables and their indexes keep only plans in use. Archived plan keeps its id
+# and is moved back when it is opened.
+PLAN_ARCHIVE_DAYS = getattr(settings, 'PLAN_ARCHIVE_DAYS', 365)
+PLAN_ARCHIVE_CHUNK_SIZE = 500
+PLAN_USED_UPDATE_INTERVAL = timedelta(days=1)
+
+
+def archivable_plans(days=PLAN_ARCHIVE_DAYS):
+    """
+    Function used to get plans unused for given number of days. Active and favourite plans are never archived.
+    """
+    return (m.Plan.objects.filter(date_used__lt=timezone.now() - timedelta(days=days),
+                                  selectedplan=None, favouriteplan=None)
+            .order_by('id'))
+
+
+def archive_plans(days=PLAN_ARCHIVE_DAYS, chunk_size=PLAN_ARCHIVE_CHUNK_SIZE, progress=None):
+    """
+    Function used to move unused plans with their meals and bought products to archive tables,
+    chunk by chunk, each in its own transaction. Returns number of archived plans.
+    """
+    done = 0
+    while plan_ids := list(archivable_plans(days).values_list('id', flat=True)[:chunk_size]):
+        with transaction.atomic():
+            # Plans are checked again under lock, so plan chosen as active or favourite in the meantime stays.
+            chunk = list(archivable_plans(days).filter(id__in=plan_ids).select_for_update(of=('self',)))
+            plan_ids = [plan.id for plan in chunk]
+            bought_product_ids = {}
+            for plan_id, product_id in m.PlanBoughtProduct.objects.filter(plan_id__in=plan_ids) \
+                    .values_list('plan_id', 'product_id'):
+                bought_product_ids.setdefault(plan_id, []).append(product_id)
+            m.ArchivedPlan.objects.bulk_create([
+                m.ArchivedPlan(id=plan.id, name=plan.name, date_created=plan.date_created,
+                               date_used=plan.date_used, user_id=plan.user_id, type=plan.type,
+                               persons=plan.persons, bought_product_ids=bought_product_ids.get(plan.id, []))
+                for plan in chunk])
+            plan_meals = list(m.PlanMeal.objects.filter(plan_id__in=plan_ids))
+            m.ArchivedPlanMeal.objects.bulk_create([m.ArchivedPlanMeal(plan_id=plan_meal.plan_id,
+                                                                       meal_id=plan_meal.meal_id)
+                                                    for plan_meal in plan_meals], batch_size=chunk_size)
+            # Archived plans are not gone, change log gets 'archive' instead of 'delete' entries.
+            with changes.suppressed():
+                m.Plan.objects.filter(id__in=plan_ids).delete()
+            changes.record('Plan', 'archive', chunk)
+            changes.record('PlanMeal', 'archive', plan_meals)
+        done += len(chunk)
+        if progress is not None:
+            progress(done)
+    return done
+
+
+def restore_plan(plan_id):
+    """
+    Function used to move archived plan with its meals and bought products back to Plan tables.
+    Returns the plan or None if there is no such archived plan.
+    """
+    try:
+        with transaction.atomic():
+            archived_plan = m.ArchivedPlan.objects.select_for_update().filter(id=plan_id).first()
+            if archived_plan is None:
+                return m.Plan.objects.filter(id=plan_id).first()
+            [plan] = m.Plan.objects.bulk_create([m.Plan(id=archived_plan.id, name=archived_plan.name,
+                                                        user_id=archived_plan.user_id, type=archived_plan.type,
+                                                        persons=archived_plan.persons)])
+            m.Plan.objects.filter(id=plan.id).update(date_created=archived_plan.date_created)
+            plan.date_created = archived_plan.date_created
+            m.PlanMeal.objects.bulk_create([
+                m.PlanMeal(plan_id=plan.id, meal_id=meal_id)
+                for meal_id in archived_plan.archivedplanmeal_set.values_list('meal_id', flat=True).iterator()],
+                batch_size=PLAN_ARCHIVE_CHUNK_SIZE)
+            m.PlanBoughtProduct.objects.bulk_create([
+                m.PlanBoughtProduct(plan_id=plan.id, product_id=product_id)
+                for product_id in m.Product.objects.filter(id__in=archived_plan.bought_product_ids)
+                .values_list('id', flat=True)])
+            archived_plan.delete()
+            changes.record('Plan', 'restore', [plan])
+            changes.record('PlanMeal', 'restore', m.PlanMeal.objects.filter(plan_id=plan.id))
+    except IntegrityError:
+        # The plan was restored by concurrent request.
+        return m.Plan.objects.filter(id=plan_id).first()
+    return plan
+
+
+def mark_used(plan):
+    """
+    Function used to save that plan was opened, at most once per PLAN_USED_UPDATE_INTERVAL.
+    """
+    now = timezone.now()
+    if now - plan.date_used > PLAN_USED_UPDATE_INTERVAL:
+        m.Plan.objects.filter(id=plan.id).update(date_used=now)
+        plan.date_used = now
+
+
+def get_plan_or_404(plan_id):
+    """
+    Function used to get plan opened by user, archived plan is restored first. Raises Http404 if there is no plan.
+    """
+    plan = m.Plan.objects.filter(id=plan_id).first() or restore_plan(plan_id)
+    if plan is None:
+        raise Http404('No Plan matches the given query.')
+    mark_used(plan)
+    return plan
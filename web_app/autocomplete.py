@@ -0,0 +1,92 @@
+import threading
+import unicodedata
+from bisect import bisect_left
+
+from web_app import changes
+from web_app import models as m
+
+# Names of products and meals are kept in memory of each process as sorted arrays of diacritic-folded
+# keys, one key for each word start, so prefix of any word is found by binary search. Index is rebuilt
+# when change log cursor of indexed model shows that products or meals changed.
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+FOLDED_LETTERS = str.maketrans({'ł': 'l', 'Ł': 'l', 'ß': 'ss', 'ø': 'o', 'Ø': 'o', 'đ': 'd', 'Đ': 'd'})
+
+
+def fold(text):
+    """
+    Function used to bring text to searchable form: lowercase, without diacritics and extra spaces.
+    """
+    text = unicodedata.normalize('NFKD', text.translate(FOLDED_LETTERS))
+    return ' '.join(''.join(char for char in text if not unicodedata.combining(char)).casefold().split())
+
+
+class PrefixIndex:
+    """
+    Sorted array of (folded key, position) pairs, searched by prefix with bisect.
+    """
+    def __init__(self, items):
+        self.items = items
+        self.names = [fold(item['name']) for item in items]
+        keys = []
+        for position, name in enumerate(self.names):
+            words = name.split(' ')
+            keys += [(' '.join(words[number:]), position) for number in range(len(words))]
+        keys.sort()
+        self.keys = [key for key, _ in keys]
+        self.positions = [position for _, position in keys]
+
+    def search(self, query, limit=AUTOCOMPLETE_LIMIT):
+        """
+        Function used to find limit items with any word starting with query,
+        items with name starting with the query are listed first, then items in name order.
+        """
+        prefix = fold(query)
+        if not prefix:
+            return []
+        found = set()
+        for number in range(bisect_left(self.keys, prefix), len(self.keys)):
+            if not self.keys[number].startswith(prefix):
+                break
+            found.add(self.positions[number])
+        ranked = sorted(found, key=lambda position: (not self.names[position].startswith(prefix), position))
+        return [self.items[position] for position in ranked[:limit]]
+
+
+def product_items():
+    return [{'id': product_id, 'name': name, 'price': str(price)}
+            for product_id, name, price in m.Product.objects.order_by('name', 'id')
+            .values_list('id', 'name', 'price').iterator()]
+
+
+def meal_items():
+    return [{'id': meal_id, 'name': name}
+            for meal_id, name in m.Meal.objects.order_by('name', 'id').values_list('id', 'name').iterator()]
+
+
+SOURCES = {'products': (product_items, 'Product'), 'meals': (meal_items, 'Meal')}
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index(kind):
+    """
+    Function used to get prefix index of products or meals, rebuilt if catalog changed since it was built.
+    """
+    items, model_name = SOURCES[kind]
+    version = changes.latest_cursor([model_name])
+    built = _indexes.get(kind)
+    if built is None or built[0] != version:
+        with _lock:
+            built = _indexes.get(kind)
+            if built is None or built[0] != version:
+                built = _indexes[kind] = (version, PrefixIndex(items()))
+    return built[1]
+
+
+def search(kind, query, limit=AUTOCOMPLETE_LIMIT):
+    """
+    Function used to find products or meals matching typed text, returns at most limit items.
+    Limit is kept between 1 and AUTOCOMPLETE_MAX_LIMIT.
+    """
+    return get_index(kind).search(query, max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT)))
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from web_app import metrics
+
+PERMISSIONS_CACHE_TIMEOUT = getattr(settings, 'PERMISSIONS_CACHE_TIMEOUT', 60 * 60)
+
+
+def permissions_cache_key(user_id):
+    return f'permissions:{user_id}'
+
+
+def invalidate_permissions(user_ids):
+    """
+    Function used to drop cached permissions of given users.
+    """
+    cache.delete_many([permissions_cache_key(user_id) for user_id in user_ids])
+
+
+class CachedPermissionBackend(ModelBackend):
+    """
+    Authentication backend keeping resolved user and group permissions in the cache backend,
+    so permission checks of warm requests don't query permission tables.
+    """
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permissions_cache_key(user_obj.pk)
+            permissions = cache.get(key)
+            metrics.inc('cache_requests_total',
+                        {'cache': 'permissions', 'result': 'miss' if permissions is None else 'hit'})
+            if permissions is None:
+                permissions = super().get_all_permissions(user_obj)
+                cache.set(key, permissions, PERMISSIONS_CACHE_TIMEOUT)
+            user_obj._perm_cache = permissions
+        return user_obj._perm_cache
@@ -0,0 +1,164 @@
+import datetime
+import gzip
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from itertools import islice
+
+from django.core.management.base import CommandError
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from web_app import models as m
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Models in dependency order, every model may only point at models listed before it.
+CATALOG_MODELS = [
+    m.ProductType,
+    m.Product,
+    m.Meal,
+    m.MealProduct,
+    m.Plan,
+    m.PlanMeal,
+    m.PlanBoughtProduct,
+    m.ArchivedPlan,
+    m.ArchivedPlanMeal,
+    m.SelectedPlan,
+    m.FavouriteMeal,
+    m.FavouriteMeal.meal.through,
+    m.FavouritePlan,
+    m.FavouritePlan.plan.through,
+]
+COMPRESSIONS = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+class ExportEncoder(DjangoJSONEncoder):
+    """
+    JSON encoder keeping full precision of dates, DjangoJSONEncoder cuts them to milliseconds.
+    """
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def file_name(model, compression):
+    return f'{model._meta.label_lower}.ndjson{COMPRESSIONS[compression]}'
+
+
+def open_file(path, mode, compression):
+    """
+    Function used to open NDJSON file as binary stream, compressed with gzip or zstd.
+    """
+    if compression == 'gzip':
+        return gzip.open(path, mode + 'b')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise CommandError('Kompresja zstd wymaga pakietu zstandard.')
+        if mode == 'w':
+            return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, mode + 'b')
+
+
+def export_model(model, path, compression, chunk_size):
+    """
+    Function used to write all rows of model to NDJSON file, reading them in chunks. Returns number of rows.
+    """
+    fields = [field.attname for field in model._meta.concrete_fields]
+    count = 0
+    with open_file(path, 'w', compression) as file:
+        rows = model.objects.order_by('pk').values_list(*fields).iterator(chunk_size=chunk_size)
+        for row in rows:
+            file.write(json.dumps(dict(zip(fields, row)), cls=ExportEncoder).encode() + b'\n')
+            count += 1
+    return count
+
+
+def read_rows(path, compression):
+    """
+    Generator yielding rows of NDJSON file one by one.
+    """
+    with open_file(path, 'r', compression) as file:
+        buffer = b''
+        while True:
+            data = file.read(1 << 16)
+            if not data:
+                break
+            buffer += data
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                if line:
+                    yield json.loads(line)
+        if buffer.strip():
+            yield json.loads(buffer)
+
+
+@contextmanager
+def original_dates(model):
+    """
+    Context manager switching off auto_now and auto_now_add, so imported dates are kept.
+    """
+    fields = [field for field in model._meta.concrete_fields if getattr(field, 'auto_now_add', False)
+              or getattr(field, 'auto_now', False)]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def insert_batch(model, rows, in_thread):
+    """
+    Function used to save one batch of rows in its own transaction.
+    """
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create([model(**row) for row in rows])
+    finally:
+        if in_thread:
+            connection.close()
+    return len(rows)
+
+
+def import_model(model, path, compression, batch_size, workers):
+    """
+    Function used to load NDJSON file into model table with bulk inserts. With more workers batches are saved
+    in parallel threads, at most two batches per worker are kept in memory. Returns number of rows.
+    """
+    rows = read_rows(path, compression)
+    count = 0
+    with original_dates(model):
+        if workers <= 1:
+            while batch := list(islice(rows, batch_size)):
+                count += insert_batch(model, batch, in_thread=False)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pending = set()
+                while batch := list(islice(rows, batch_size)):
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        count += sum(future.result() for future in done)
+                    pending.add(executor.submit(insert_batch, model, batch, True))
+                count += sum(future.result() for future in wait(pending).done)
+    reset_sequences(model)
+    return count
+
+
+def reset_sequences(model):
+    """
+    Function used to move primary key sequence after rows imported with explicit ids.
+    """
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
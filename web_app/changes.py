@@ -0,0 +1,94 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from web_app import jobs
+from web_app import models as m
+
+TRACKED_MODELS = ('Product', 'ProductType', 'Meal', 'MealProduct', 'Plan', 'PlanMeal')
+CHANGE_LOG_RETENTION = getattr(settings, 'CHANGE_LOG_RETENTION', timedelta(days=30))
+CHANGE_LOG_COMPACT_EVERY = getattr(settings, 'CHANGE_LOG_COMPACT_EVERY', 1000)
+CHANGE_FEED_LIMIT = 1000
+# Sequence numbers are given at insert, not at commit, so under concurrent writers a newer entry can be visible
+# before an older one is committed. The feed skips entries younger than CHANGE_FEED_LAG, so a client moving its
+# cursor does not pass entries of transactions still running. Transactions longer than the lag can still be missed.
+CHANGE_FEED_LAG = getattr(settings, 'CHANGE_FEED_LAG', timedelta(seconds=5))
+
+_suppressed = ContextVar('changes_suppressed', default=False)
+
+
+@contextmanager
+def suppressed():
+    """
+    Context manager switching off per object change log signal receivers, for code recording its changes itself.
+    """
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+def is_suppressed():
+    return _suppressed.get()
+
+
+def object_data(instance):
+    """
+    Function used to get values of concrete fields of changed object.
+    """
+    return {field.attname: field.value_from_object(instance) for field in instance._meta.concrete_fields}
+
+
+def record(model, action, objects):
+    """
+    Function used to append changes of objects to change log. Every CHANGE_LOG_COMPACT_EVERY entries
+    'compact_changes' job is queued, so log is compacted by worker, not in request writing the change.
+    """
+    entries = m.ChangeLog.objects.bulk_create([
+        m.ChangeLog(model=model, object_id=obj.pk, action=action,
+                    data=None if action == 'delete' else object_data(obj)) for obj in objects])
+    if entries and entries[-1].id and entries[-1].id % CHANGE_LOG_COMPACT_EVERY < len(entries):
+        jobs.enqueue_on_commit('compact_changes')
+
+
+def compact(retention=CHANGE_LOG_RETENTION):
+    """
+    Function used to remove entries older than retention period which are superseded by newer entry
+    of the same object. Returns number of removed entries.
+    """
+    latest = m.ChangeLog.objects.values('model', 'object_id').annotate(last_id=Max('id')).values('last_id')
+    removed, _ = (m.ChangeLog.objects.filter(date_created__lt=timezone.now() - retention)
+                  .exclude(id__in=latest).delete())
+    return removed
+
+
+def changes_since(cursor=0, limit=CHANGE_FEED_LIMIT):
+    """
+    Function used to get page of changes newer than cursor and older than CHANGE_FEED_LAG, with cursor of the
+    next page. Limit is kept between 1 and CHANGE_FEED_LIMIT.
+    """
+    limit = max(1, min(limit, CHANGE_FEED_LIMIT))
+    entries = list(m.ChangeLog.objects.filter(id__gt=cursor, date_created__lte=timezone.now() - CHANGE_FEED_LAG)
+                   [:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    return {'changes': [{'seq': entry.id, 'model': entry.model, 'id': entry.object_id, 'action': entry.action,
+                         'data': entry.data, 'date': entry.date_created} for entry in entries],
+            'cursor': entries[-1].id if entries else cursor,
+            'has_more': has_more}
+
+
+def latest_cursor(model_names=None):
+    """
+    Function used to get sequence number of the newest change of given models, or of any model if they are not
+    given. It grows whenever these models change, so it can be used as version of cached data built from them.
+    """
+    if model_names is None:
+        return m.ChangeLog.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    return max((m.ChangeLog.objects.filter(model=model_name).order_by('-id').values_list('id', flat=True).first()
+                or 0 for model_name in model_names), default=0)
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',
+                        'django.core.cache.backends.dummy.DummyCache')
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Function used to warn when default cache is kept in memory of each process, so cached permissions
+    and favourites invalidated by one worker process stay stale in the others.
+    """
+    if settings.DEBUG or settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning('Domyślny cache nie jest współdzielony przez procesy aplikacji.',
+                    hint='Ustaw wspólny cache (Redis lub Memcached) jako CACHES w local_settings.py.',
+                    id='web_app.W001')]
@@ -0,0 +1,95 @@
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from web_app import changes
+from web_app import metrics
+from web_app import models as m
+
+# Counts of facet values come from one grouped query cached under the change log cursor of counted model,
+# so they are counted again only after objects of this model change.
+FACETS_CACHE_TIMEOUT = 60 * 60
+TYPE_LABELS = {1: 'Mięsne', 2: 'Wegetariańskie', 3: 'Wegańskie'}
+RANGE_FILTERS = (('price_min', 'price__gte'), ('price_max', 'price__lte'),
+                 ('kcal_min', 'kcal__gte'), ('kcal_max', 'kcal__lte'))
+
+
+def parse_id(value):
+    """
+    Function used to read id from request parameter, returns None if it is not a number.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_number(value):
+    """
+    Function used to read range bound from request parameter, returns None if it is empty or not a number.
+    """
+    try:
+        number = Decimal(value)
+    except (TypeError, ValueError, InvalidOperation):
+        return None
+    return number if number.is_finite() else None
+
+
+def facet_counts(name, queryset, field, filters=None):
+    """
+    Function used to count objects of queryset by value of field with one grouped query.
+    Counts are cached per facet, applied filters and version of counted model.
+    """
+    filters_hash = hashlib.sha1(json.dumps(filters or {}, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    key = f'facets:{name}:{filters_hash}:{changes.latest_cursor([queryset.model.__name__])}'
+    counts = cache.get(key)
+    metrics.inc('cache_requests_total', {'cache': 'facets', 'result': 'miss' if counts is None else 'hit'})
+    if counts is None:
+        counts = dict(queryset.filter(**(filters or {})).order_by().values_list(field).annotate(count=Count('id')))
+        cache.set(key, counts, FACETS_CACHE_TIMEOUT)
+    return counts
+
+
+def facet_options(choices, counts, selected):
+    """
+    Function used to build options of facet select as list of dicts with value, label, count and selected flag.
+    """
+    return [{'value': value, 'label': label, 'count': f'{counts.get(value, 0):,}', 'selected': value == selected}
+            for value, label in choices]
+
+
+def type_facet(name, model, request):
+    """
+    Function used to filter meals or plans by 'type' request parameter.
+    Returns filtered queryset, facet options and selected type.
+    """
+    selected = parse_id(request.GET.get('type'))
+    objects = model.objects.all()
+    counts = facet_counts(name, objects, 'type')
+    if selected is not None:
+        objects = objects.filter(type=selected)
+    return objects, facet_options(TYPE_LABELS.items(), counts, selected), selected
+
+
+def product_facets(request):
+    """
+    Function used to filter products by product type, price range and kcal range request parameters.
+    Product type counts are given for products in selected price and kcal ranges.
+    Returns filtered queryset, facet options and applied ranges.
+    """
+    ranges = {}
+    for parameter, lookup in RANGE_FILTERS:
+        value = parse_number(request.GET.get(parameter))
+        if value is not None:
+            ranges[lookup] = value
+    selected = parse_id(request.GET.get('type'))
+    products = m.Product.objects.filter(**ranges)
+    counts = facet_counts('product_type', m.Product.objects.all(), 'type', ranges)
+    if selected is not None:
+        products = products.filter(type_id=selected)
+    choices = m.ProductType.objects.order_by('name').values_list('id', 'name')
+    values = {parameter: request.GET.get(parameter, '') for parameter, _ in RANGE_FILTERS}
+    return products, facet_options(choices, counts, selected), values
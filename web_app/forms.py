@@ -9,6 +9,7 @@ TYPES = (
     (2, 'wegetariański'),
     (3, 'wegański')
 )
+MAX_GRAMS = 100000
 
 
 class LoginForm(f.Form):
@@ -76,6 +77,25 @@ class MealProductAddForm(f.Form):
                                          widget=f.CheckboxSelectMultiple, label='Dodaj produkty:')
 
 
+class MealProductGramsForm(f.Form):
+    """
+    Form with grammage field for each product of meal, fields are named 'grams_<MealProduct id>'.
+    """
+    def __init__(self, meal_products, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.meal_products = meal_products
+        for meal_product in meal_products:
+            self.fields[f'grams_{meal_product.id}'] = f.IntegerField(label=meal_product.product.name, min_value=0,
+                                                                     max_value=MAX_GRAMS,
+                                                                     initial=meal_product.grams)
+
+    def grams(self):
+        """
+        Function used to get valid grammage of each product as {MealProduct: grams}.
+        """
+        return {meal_product: self.cleaned_data[f'grams_{meal_product.id}'] for meal_product in self.meal_products}
+
+
 class ProductAddForm(f.ModelForm):
     class Meta:
         model = m.Product
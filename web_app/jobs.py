@@ -0,0 +1,217 @@
+import logging
+import threading
+import time
+import traceback
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from web_app import catalog_io
+from web_app import changes
+from web_app import models as m
+from web_app import services
+from web_app import similarity
+
+logger = logging.getLogger(__name__)
+
+JOB_RETRY_DELAY = getattr(settings, 'JOB_RETRY_DELAY', 10)
+# Running job saves heartbeat every JOB_HEARTBEAT_INTERVAL seconds, job without heartbeat for JOB_LEASE_TIMEOUT
+# seconds is treated as lost by crashed or killed worker and queued again.
+JOB_HEARTBEAT_INTERVAL = getattr(settings, 'JOB_HEARTBEAT_INTERVAL', 30)
+JOB_LEASE_TIMEOUT = getattr(settings, 'JOB_LEASE_TIMEOUT', 5 * 60)
+JOB_CHUNK_SIZE = 500
+TASKS = {}
+
+
+def task(name):
+    """
+    Decorator registering function as job task. Task gets running Job as first argument and job kwargs.
+    """
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+
+def enqueue(name, max_attempts=3, **kwargs):
+    """
+    Function used to save new job to be run by worker, returns the job.
+    """
+    if name not in TASKS:
+        raise KeyError(f'Unknown task: {name}')
+    return m.Job.objects.create(name=name, kwargs=kwargs, max_attempts=max_attempts)
+
+
+def enqueue_on_commit(name, **kwargs):
+    """
+    Function used to save new job after transaction commit, unless the same job is already waiting.
+    """
+    def save():
+        if not m.Job.objects.filter(name=name, kwargs=kwargs, status='queued').exists():
+            enqueue(name, **kwargs)
+    transaction.on_commit(save)
+
+
+def requeue_lost_jobs():
+    """
+    Function used to queue again jobs whose worker stopped sending heartbeat, or mark them as failed
+    when they have no attempts left. Returns number of requeued and failed jobs.
+    """
+    now = timezone.now()
+    lost = m.Job.objects.filter(status='running', date_heartbeat__lt=now - timedelta(seconds=JOB_LEASE_TIMEOUT))
+    error = 'Worker stopped while running the job.'
+    requeued = lost.filter(attempts__lt=F('max_attempts')).update(status='queued', run_after=None, error=error)
+    failed = lost.update(status='failed', date_finished=now, error=error)
+    return requeued, failed
+
+
+def claim_job():
+    """
+    Function used to take oldest waiting job. Job is claimed by conditional update, so many workers
+    can poll the same table without locks. Attempt is counted at once, so attempts of crashed workers count too.
+    Returns None if there is no job to run.
+    """
+    requeue_lost_jobs()
+    now = timezone.now()
+    waiting = (m.Job.objects.filter(Q(run_after__isnull=True) | Q(run_after__lte=now), status='queued')
+               .order_by('id').values_list('id', flat=True))
+    for job_id in waiting[:10]:
+        if m.Job.objects.filter(id=job_id, status='queued').update(status='running', date_started=now,
+                                                                   date_heartbeat=now, attempts=F('attempts') + 1):
+            return m.Job.objects.get(id=job_id)
+    return None
+
+
+class Heartbeat(threading.Thread):
+    """
+    Thread saving heartbeat of running job every JOB_HEARTBEAT_INTERVAL seconds, until stopped.
+    """
+    def __init__(self, job_id):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(JOB_HEARTBEAT_INTERVAL):
+                m.Job.objects.filter(id=self.job_id, status='running').update(date_heartbeat=timezone.now())
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job):
+    """
+    Function used to run claimed job, failed job is queued again with growing delay until max_attempts.
+    """
+    heartbeat = Heartbeat(job.id)
+    heartbeat.start()
+    try:
+        result = TASKS[job.name](job, **job.kwargs)
+    except Exception:
+        job.error = traceback.format_exc()
+        logger.exception('Job %s failed', job.id)
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = timezone.now() + timedelta(seconds=JOB_RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+            job.date_finished = timezone.now()
+    else:
+        job.status = 'done'
+        job.result = result
+        job.progress = job.total or job.progress
+        job.date_finished = timezone.now()
+    finally:
+        heartbeat.stop()
+    job.save(update_fields=['status', 'result', 'error', 'run_after', 'progress', 'date_finished'])
+    return job
+
+
+def work(poll_interval=1.0, once=False):
+    """
+    Worker loop running jobs one by one. With once=True returns when there are no jobs left.
+    """
+    while True:
+        close_old_connections()
+        job = claim_job()
+        if job is not None:
+            run_job(job)
+        elif once:
+            return
+        else:
+            time.sleep(poll_interval)
+
+
+@task('rebuild_similar_meals')
+def rebuild_similar_meals_task(job):
+    return similarity.rebuild_similar_meals()
+
+
+@task('compact_changes')
+def compact_changes_task(job):
+    return changes.compact()
+
+
+@task('refresh_similar_meals')
+def refresh_similar_meals_task(job, meal_id):
+    similarity.refresh_similar_meals(meal_id)
+
+
+@task('export_catalog')
+def export_catalog_task(job, directory, compression='gzip'):
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    job.set_progress(0, len(catalog_io.CATALOG_MODELS))
+    counts = {}
+    for number, model in enumerate(catalog_io.CATALOG_MODELS, 1):
+        path = Path(directory) / catalog_io.file_name(model, compression)
+        counts[model._meta.label] = catalog_io.export_model(model, path, compression, 2000)
+        job.set_progress(number)
+    return counts
+
+
+@task('change_product_prices')
+def change_product_prices_task(job, percent, product_type_id=None, chunk_size=JOB_CHUNK_SIZE):
+    products = m.Product.objects.order_by('id')
+    if product_type_id is not None:
+        products = products.filter(type_id=product_type_id)
+    job.set_progress(0, products.count())
+    factor = Decimal(100 + percent) / 100
+    done, last_id = 0, 0
+    while chunk := list(products.filter(id__gt=last_id)[:chunk_size]):
+        for product in chunk:
+            product.price = (product.price * factor).quantize(Decimal('0.01'))
+        with transaction.atomic():
+            m.Product.objects.bulk_update(chunk, ['price'])
+            changes.record('Product', 'update', chunk)
+        done, last_id = done + len(chunk), chunk[-1].id
+        job.set_progress(done)
+    return done
+
+
+@task('delete_product_type')
+def delete_product_type_task(job, product_type_id, chunk_size=JOB_CHUNK_SIZE):
+    products = m.Product.objects.filter(type_id=product_type_id)
+    job.set_progress(0, products.count())
+    done = 0
+    while chunk_ids := list(products.values_list('id', flat=True)[:chunk_size]):
+        with transaction.atomic():
+            m.Product.objects.filter(id__in=chunk_ids).delete()
+        done += len(chunk_ids)
+        job.set_progress(done)
+    m.ProductType.objects.filter(id=product_type_id).delete()
+    return done
+
+
+@task('delete_user')
+def delete_user_task(job, user_id, chunk_size=JOB_CHUNK_SIZE):
+    job.set_progress(0, services.user_object_count(user_id))
+    return services.delete_user(user_id, chunk_size, job.set_progress)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from web_app import archive
+
+
+class Command(BaseCommand):
+    help = 'Moves plans unused for given number of days with their meals to archive tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=archive.PLAN_ARCHIVE_DAYS,
+                            help='Plans not opened for this number of days are archived.')
+        parser.add_argument('--chunk-size', type=int, default=archive.PLAN_ARCHIVE_CHUNK_SIZE,
+                            help='Number of plans moved in one transaction.')
+
+    def handle(self, *args, **options):
+        count = archive.archive_plans(options['days'], options['chunk_size'])
+        self.stdout.write(f'Zarchiwizowano {count} planów.')
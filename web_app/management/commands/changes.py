@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from web_app import changes
+
+
+class Command(BaseCommand):
+    help = 'Prints catalog changes newer than given cursor as JSON lines, or compacts change log.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=int, default=0, help='Cursor (sequence number) of last seen change.')
+        parser.add_argument('--limit', type=int, default=None, help='Maximum number of changes to print.')
+        parser.add_argument('--compact', action='store_true', help='Remove old superseded changes instead.')
+
+    def handle(self, *args, **options):
+        if options['compact']:
+            self.stdout.write(f'Usunięto {changes.compact()} wpisów.')
+            return
+        cursor, left = options['since'], options['limit']
+        while left is None or left > 0:
+            page = changes.changes_since(cursor, changes.CHANGE_FEED_LIMIT if left is None
+                                         else min(left, changes.CHANGE_FEED_LIMIT))
+            for change in page['changes']:
+                self.stdout.write(json.dumps(change, cls=DjangoJSONEncoder))
+            cursor = page['cursor']
+            if left is not None:
+                left -= len(page['changes'])
+            if not page['has_more']:
+                break
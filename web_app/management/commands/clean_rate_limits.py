@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from web_app import rate_limits
+
+
+class Command(BaseCommand):
+    help = 'Removes rate limit buckets which are full again.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Usunięto {rate_limits.remove_full_buckets()} liczników.')
@@ -0,0 +1,22 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from web_app import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Exports web_app models to directory as NDJSON files, one per model, streaming rows in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Output directory.')
+        parser.add_argument('--compression', choices=catalog_io.COMPRESSIONS, default='gzip')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        directory = Path(options['directory'])
+        directory.mkdir(parents=True, exist_ok=True)
+        for model in catalog_io.CATALOG_MODELS:
+            path = directory / catalog_io.file_name(model, options['compression'])
+            count = catalog_io.export_model(model, path, options['compression'], options['chunk_size'])
+            self.stdout.write(f'{model._meta.label}: {count}')
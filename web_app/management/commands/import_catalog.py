@@ -0,0 +1,26 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from web_app import catalog_io
+
+
+class Command(BaseCommand):
+    help = ('Imports web_app models from NDJSON files written by export_catalog, in dependency order. '
+            'Users referenced by meals and plans must already exist.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory with exported files.')
+        parser.add_argument('--compression', choices=catalog_io.COMPRESSIONS, default='gzip')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=1, help='Number of threads saving batches.')
+
+    def handle(self, *args, **options):
+        directory = Path(options['directory'])
+        for model in catalog_io.CATALOG_MODELS:
+            path = directory / catalog_io.file_name(model, options['compression'])
+            if not path.exists():
+                raise CommandError(f'Brak pliku {path}.')
+            count = catalog_io.import_model(model, path, options['compression'], options['batch_size'],
+                                            options['workers'])
+            self.stdout.write(f'{model._meta.label}: {count}')
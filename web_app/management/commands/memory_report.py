@@ -0,0 +1,40 @@
+import json
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Shows memory used by requests of each URL name, measured by MemoryTrackingMiddleware.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=5, help='Number of allocation sites shown for URL.')
+        parser.add_argument('--clear', action='store_true', help='Clear collected measurements.')
+
+    def handle(self, *args, **options):
+        path = settings.MEMORY_TRACKING_LOG
+        if options['clear']:
+            open(path, 'w').close()
+            return
+        try:
+            file = open(path)
+        except FileNotFoundError:
+            raise CommandError(f'Brak pomiarów w {path}, włącz MEMORY_TRACKING.')
+        urls = defaultdict(lambda: {'count': 0, 'peak': 0, 'peak_sum': 0, 'retained_sum': 0, 'sites': Counter()})
+        with file:
+            for line in file:
+                record = json.loads(line)
+                url = urls[record['url_name']]
+                url['count'] += 1
+                url['peak'] = max(url['peak'], record['peak'])
+                url['peak_sum'] += record['peak']
+                url['retained_sum'] += record['retained']
+                for site in record['top']:
+                    url['sites'][site['site']] += site['size']
+        for url_name, url in sorted(urls.items(), key=lambda item: -item[1]['peak']):
+            self.stdout.write(f"{url_name}: {url['count']} zapytań, max peak {url['peak'] / 1024:.1f} KiB, "
+                              f"średni peak {url['peak_sum'] / url['count'] / 1024:.1f} KiB, "
+                              f"średnio pozostaje {url['retained_sum'] / url['count'] / 1024:.1f} KiB")
+            for site, size in url['sites'].most_common(options['top']):
+                self.stdout.write(f'    {site}: {size / 1024:.1f} KiB')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from web_app import similarity
+
+
+class Command(BaseCommand):
+    help = 'Recounts LSH buckets and similar meals of all meals based on their products.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=similarity.SIMILAR_MEALS_COUNT,
+                            help='Number of similar meals stored for each meal.')
+
+    def handle(self, *args, **options):
+        saved = similarity.rebuild_similar_meals(options['count'])
+        self.stdout.write(f'Zapisano {saved} podobnych dań.')
@@ -0,0 +1,34 @@
+import multiprocessing
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from web_app import jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs background jobs saved in database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Number of jobs run at the same time.')
+        parser.add_argument('--mode', choices=('thread', 'process'), default='thread')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between checks for new jobs.')
+        parser.add_argument('--once', action='store_true', help='Exit when there are no jobs left.')
+
+    def handle(self, *args, **options):
+        kwargs = {'poll_interval': options['poll_interval'], 'once': options['once']}
+        if options['concurrency'] <= 1:
+            jobs.work(**kwargs)
+            return
+        if options['mode'] == 'process':
+            connections.close_all()
+            workers = [multiprocessing.Process(target=jobs.work, kwargs=kwargs)
+                       for _ in range(options['concurrency'])]
+        else:
+            workers = [threading.Thread(target=jobs.work, kwargs=kwargs, daemon=True)
+                       for _ in range(options['concurrency'])]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from web_app import slow_queries
+
+
+class Command(BaseCommand):
+    help = 'Shows slowest queries recorded with SLOW_QUERY_THRESHOLD, grouped by normalized SQL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Number of queries shown.')
+        parser.add_argument('--order', choices=['total', 'max', 'average', 'count'], default='total',
+                            help='Sort queries by total, max or average duration or by count.')
+        parser.add_argument('--explain', action='store_true', help='Show EXPLAIN plan of each query.')
+        parser.add_argument('--clear', action='store_true', help='Clear recorded queries.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            open(slow_queries.log_path(), 'w').close()
+            return
+        for group in slow_queries.summary(options['top'], options['order']):
+            self.stdout.write(f"{group['total']:.3f} s łącznie, {group['count']} razy, "
+                              f"max {group['max']:.3f} s, średnio {group['average']:.3f} s")
+            self.stdout.write(f"    {group['sql']}")
+            for site in sorted(group['sites']):
+                self.stdout.write(f'    {site}')
+            if options['explain'] and group['explain']:
+                for line in group['explain'].splitlines():
+                    self.stdout.write(f'        {line}')
@@ -0,0 +1,257 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Metrics are kept in plain dicts of this process, written to METRICS_DIR/<pid>.json every
+# METRICS_FLUSH_INTERVAL seconds by background thread and summed over all files when scraped.
+# When process writes its first file, counters and histograms of processes which are not running anymore
+# are added to aggregate.json and their files are removed, so summed counters never go down. Their active users
+# are dropped. Folding and reading the files is guarded by a lock file.
+AGGREGATE_FILE = 'aggregate.json'
+METRICS_FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+ACTIVE_USERS_WINDOW = 5 * 60
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+DESCRIPTIONS = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by URL name.'),
+    'db_queries_per_request': ('histogram', 'Number of database queries per request by URL name.'),
+    'db_query_duration_seconds': ('histogram', 'Database query time by URL name.'),
+    'cache_requests_total': ('counter', 'Cache lookups by cache and result.'),
+    'plans_created_total': ('counter', 'Plans created.'),
+    'random_meals_added_total': ('counter', 'Random meals added to plans.'),
+    'rate_limited_requests_total': ('counter', 'Requests rejected by rate limits by URL name and client.'),
+    'active_users': ('gauge', 'Users with requests in last 5 minutes.'),
+}
+
+_counters = defaultdict(float)
+_histograms = {}
+_users = {}
+_lock = threading.Lock()
+_flusher = None
+
+
+def _key(name, labels):
+    return json.dumps([name, sorted((labels or {}).items())])
+
+
+def inc(name, labels=None, value=1):
+    """
+    Function used to increase counter.
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += value
+    start_flusher()
+
+
+def observe(name, value, labels=None, buckets=LATENCY_BUCKETS):
+    """
+    Function used to add observation to histogram.
+    """
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0.0,
+                                            'count': 0}
+        for number, bound in enumerate(histogram['buckets']):
+            if value <= bound:
+                histogram['counts'][number] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+    start_flusher()
+
+
+def seen_user(user_id):
+    """
+    Function used to remember that user made a request, for active users gauge.
+    """
+    with _lock:
+        _users[str(user_id)] = time.time()
+    start_flusher()
+
+
+def metrics_dir():
+    return Path(getattr(settings, 'METRICS_DIR', Path(settings.BASE_DIR) / 'metrics'))
+
+
+def process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+@contextmanager
+def files_lock(exclusive):
+    """
+    Context manager holding lock of metrics directory, exclusive for changing files of other processes.
+    Without fcntl (Windows) files are not locked.
+    """
+    with open(metrics_dir() / 'metrics.lock', 'a') as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def read_file(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def merge(counters, histograms, users, data):
+    """
+    Function used to add metrics of one file to summed counters, histograms and users.
+    """
+    for key, value in data['counters'].items():
+        counters[key] += value
+    for key, histogram in data['histograms'].items():
+        total = histograms.setdefault(key, {'buckets': histogram['buckets'], 'sum': 0.0, 'count': 0,
+                                            'counts': [0] * len(histogram['counts'])})
+        total['counts'] = [first + second for first, second in zip(total['counts'], histogram['counts'])]
+        total['sum'] += histogram['sum']
+        total['count'] += histogram['count']
+    for user_id, seen in data['users'].items():
+        users[user_id] = max(seen, users.get(user_id, 0))
+
+
+def fold_stale_files():
+    """
+    Function used to add counters and histograms of processes which are not running anymore to aggregate file
+    and remove their files. Returns number of folded files.
+    """
+    directory = metrics_dir()
+    with files_lock(exclusive=True):
+        stale = [path for path in directory.glob('*.json') if path.stem.isdigit()
+                 and int(path.stem) != os.getpid() and not process_running(int(path.stem))]
+        if not stale:
+            return 0
+        aggregate = read_file(directory / AGGREGATE_FILE) or {'counters': {}, 'histograms': {}, 'users': {}}
+        counters, histograms = defaultdict(float, aggregate['counters']), aggregate['histograms']
+        for path in stale:
+            data = read_file(path)
+            if data is not None:
+                merge(counters, histograms, {}, data)
+        temporary = directory / f'{AGGREGATE_FILE}.{os.getpid()}.tmp'
+        temporary.write_text(json.dumps({'counters': counters, 'histograms': histograms, 'users': {}}))
+        os.replace(temporary, directory / AGGREGATE_FILE)
+        for path in stale:
+            path.unlink(missing_ok=True)
+    return len(stale)
+
+
+def start_flusher():
+    """
+    Function used to start thread writing metrics of this process every METRICS_FLUSH_INTERVAL seconds,
+    so metrics of idle process are written too. Thread is started again in forked process.
+    """
+    global _flusher
+    if _flusher is not None and _flusher[0] == os.getpid():
+        return
+    with _lock:
+        if _flusher is not None and _flusher[0] == os.getpid():
+            return
+        thread = threading.Thread(target=_flush_periodically, name='metrics-flusher', daemon=True)
+        _flusher = (os.getpid(), thread)
+    metrics_dir().mkdir(parents=True, exist_ok=True)
+    fold_stale_files()
+    thread.start()
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def flush():
+    """
+    Function used to write metrics of this process to shared directory.
+    Metrics are copied under lock, so they are not changed by other threads while being serialized.
+    """
+    now = time.time()
+    with _lock:
+        for user_id, seen in list(_users.items()):
+            if now - seen > ACTIVE_USERS_WINDOW:
+                del _users[user_id]
+        data = {'counters': dict(_counters), 'users': dict(_users),
+                'histograms': {key: dict(histogram, counts=list(histogram['counts']))
+                               for key, histogram in _histograms.items()}}
+    directory = metrics_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{os.getpid()}.json'
+    temporary = path.with_suffix(f'.{threading.get_ident()}.tmp')
+    temporary.write_text(json.dumps(data))
+    os.replace(temporary, path)
+
+
+def collect():
+    """
+    Function used to sum metrics of all processes.
+    """
+    start_flusher()
+    flush()
+    counters = defaultdict(float)
+    histograms = {}
+    users = {}
+    with files_lock(exclusive=False):
+        for path in metrics_dir().glob('*.json'):
+            data = read_file(path)
+            if data is not None:
+                merge(counters, histograms, users, data)
+    now = time.time()
+    counters[_key('active_users', None)] = sum(1 for seen in users.values() if now - seen <= ACTIVE_USERS_WINDOW)
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def render():
+    """
+    Function used to format all metrics in Prometheus text format.
+    """
+    counters, histograms = collect()
+    lines = defaultdict(list)
+    for key, value in sorted(counters.items()):
+        name, labels = json.loads(key)
+        lines[name].append(f'{name}{_format_labels(labels)} {value:g}')
+    for key, histogram in sorted(histograms.items()):
+        name, labels = json.loads(key)
+        for bound, count in zip(histogram['buckets'], histogram['counts']):
+            lines[name].append(f'{name}_bucket{_format_labels(labels, [("le", f"{bound:g}")])} {count}')
+        lines[name].append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {histogram["count"]}')
+        lines[name].append(f'{name}_sum{_format_labels(labels)} {histogram["sum"]:g}')
+        lines[name].append(f'{name}_count{_format_labels(labels)} {histogram["count"]}')
+    output = []
+    for name, metric_lines in sorted(lines.items()):
+        kind, description = DESCRIPTIONS.get(name, ('untyped', name))
+        output += [f'# HELP {name} {description}', f'# TYPE {name} {kind}'] + metric_lines
+    return '\n'.join(output) + '\n'
@@ -0,0 +1,236 @@
+import cProfile
+import json
+import logging
+import mimetypes
+import os
+import re
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+
+from web_app import metrics
+from web_app import rate_limits
+from web_app import template_timing
+
+logger = logging.getLogger(__name__)
+
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+FAR_FUTURE = 60 * 60 * 24 * 365
+
+
+class PrecompressedStaticMiddleware:
+    """
+    Serves collected static files from STATIC_ROOT, picking precompressed .br or .gz variant
+    accepted by the browser. Fingerprinted files get far-future cache headers.
+    Does nothing in DEBUG mode, where static files are served by runserver.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        static_url = settings.STATIC_URL or ''
+        if settings.DEBUG or not settings.STATIC_ROOT or not request.path.startswith(static_url) \
+                or request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        name = request.path[len(static_url):]
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except ValueError:
+            raise Http404
+        if not os.path.isfile(path):
+            return self.get_response(request)
+        return self.serve(request, name, path)
+
+    def serve(self, request, name, path):
+        """
+        Returns file response of the best variant of static file.
+        """
+        accepted = request.headers.get('Accept-Encoding', '')
+        encoding = None
+        for candidate, extension in ENCODINGS:
+            if candidate in accepted and os.path.isfile(path + extension):
+                encoding, path = candidate, path + extension
+                break
+        stat = os.stat(path)
+        etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            response = FileResponse(open(path, 'rb'), content_type=content_type, filename=os.path.basename(name))
+            response['Content-Length'] = stat.st_size
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Vary'] = 'Accept-Encoding'
+        if HASHED_NAME.search(name):
+            response['Cache-Control'] = f'public, max-age={FAR_FUTURE}, immutable'
+        else:
+            response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        return response
+
+
+class ProfilerMiddleware:
+    """
+    Runs request under cProfile when staff user adds '_profile' parameter to URL. Profile is saved to
+    PROFILE_DIR and the response gets link to its rendered call tree. Other requests are not affected.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if '_profile' not in request.GET or not request.user.is_staff:
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        response = profiler.runcall(self.get_response, request)
+        if getattr(response, 'render', None) and not response.is_rendered:
+            response = profiler.runcall(response.render)
+        name = profile_name(request)
+        profile_dir = Path(settings.PROFILE_DIR)
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(profile_dir / f'{name}.prof')
+        url = reverse('profile_details', args=(name,))
+        response['X-Profile-URL'] = url
+        if not response.streaming and response.get('Content-Type', '').startswith('text/html'):
+            link = f'<p style="text-align: center"><a href="{url}">Profil zapytania</a></p></body>'.encode()
+            response.content = response.content.replace(b'</body>', link, 1)
+        return response
+
+
+def profile_name(request):
+    """
+    Function used to name saved profile by time and URL name of request.
+    """
+    url_name = getattr(request.resolver_match, 'url_name', None) or 'unknown'
+    return f'{time.strftime("%Y%m%d-%H%M%S")}-{url_name}-{uuid.uuid4().hex[:8]}'
+
+
+class MemoryTrackingMiddleware:
+    """
+    Measures memory allocated by each request with tracemalloc when MEMORY_TRACKING setting is on.
+    Peak and retained memory with top allocation sites are logged and appended to MEMORY_TRACKING_LOG,
+    see 'memory_report' command.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'MEMORY_TRACKING', False)
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(getattr(settings, 'MEMORY_TRACKING_FRAMES', 1))
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        response = self.get_response(request)
+        end, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        top = [{'site': str(stat.traceback[0]), 'size': stat.size_diff, 'count': stat.count_diff}
+               for stat in after.compare_to(before, 'lineno')[:getattr(settings, 'MEMORY_TRACKING_TOP', 10)]]
+        record = {'url_name': getattr(request.resolver_match, 'url_name', None) or request.path,
+                  'peak': peak - start, 'retained': end - start, 'top': top, 'time': time.time()}
+        logger.info('%s: peak %d B, retained %d B, top: %s', record['url_name'], record['peak'],
+                    record['retained'], ', '.join(f"{site['site']} {site['size']} B" for site in top[:3]))
+        with open(settings.MEMORY_TRACKING_LOG, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+        return response
+
+
+class TemplateTimingMiddleware:
+    """
+    Counts calls and time of template rendering and of every template filter and tag when TEMPLATE_TIMING
+    setting is on. Breakdown is logged and sent in Server-Timing header.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'TEMPLATE_TIMING', False)
+        if self.enabled:
+            template_timing.install()
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+        stats = template_timing.new_timings()
+        token = template_timing.timings.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            template_timing.timings.reset(token)
+        header = template_timing.server_timing(stats)
+        logger.info('%s templates: %s', request.path, header)
+        response['Server-Timing'] = ', '.join(filter(None, (response.get('Server-Timing'), header)))
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Collects request latency, database query count and time by URL name and active users for /metrics.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = {'count': 0, 'time': 0.0}
+
+        def count_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries['count'] += 1
+                queries['time'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        labels = {'view': getattr(request.resolver_match, 'url_name', None) or 'unknown'}
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - start, labels)
+        metrics.observe('db_queries_per_request', queries['count'], labels, metrics.QUERY_COUNT_BUCKETS)
+        metrics.observe('db_query_duration_seconds', queries['time'], labels)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            metrics.seen_user(user.id)
+        return response
+
+
+class RateLimitMiddleware:
+    """
+    Limits requests to URL names listed in RATE_LIMITS with token buckets kept in database, one bucket per user
+    for logged in users and per IP address for others. Bucket holds 'burst' tokens refilled evenly over
+    'period' seconds, request without token gets 429 response with Retry-After header.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        url_name = request.resolver_match.url_name
+        limit = getattr(settings, 'RATE_LIMITS', {}).get(url_name)
+        if limit is None or request.method not in limit.get('methods', (request.method,)):
+            return None
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            kind, client = 'user', user.id
+        else:
+            kind, client = 'ip', request.META.get('REMOTE_ADDR')
+        retry_after = rate_limits.take_token(f'{url_name}:{kind}:{client}', limit['burst'], limit['period'])
+        if retry_after is None:
+            return None
+        metrics.inc('rate_limited_requests_total', {'view': url_name, 'client': kind})
+        response = HttpResponse('Zbyt wiele zapytań, spróbuj ponownie za chwilę.', status=429,
+                                content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = str(retry_after)
+        return response
@@ -1,16 +1,44 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.utils import timezone
 
 # Create your models here.
 
 
+SENTINEL_USER_CACHE_KEY = 'sentinel_user_id'
+SENTINEL_USER_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_sentinel_user_id():
+    """
+    Function used to get id of 'deleted' user, the user is created when needed. Its id is cached only after
+    commit, so id of user created in a transaction which is rolled back is never cached.
+    """
+    user_id = cache.get(SENTINEL_USER_CACHE_KEY)
+    if user_id is None:
+        user_id = get_user_model().objects.get_or_create(username='deleted')[0].id
+        transaction.on_commit(lambda: cache.set(SENTINEL_USER_CACHE_KEY, user_id, SENTINEL_USER_CACHE_TIMEOUT))
+    return user_id
+
+
 def get_sentinel_user():
     """
     Function used to set products and meals creator as 'deleted' in case of user deletion.
     """
-    return get_user_model().objects.get_or_create(username='deleted')[0]
+    return get_user_model().objects.get(id=get_sentinel_user_id())
+
+
+def set_sentinel_user(collector, field, sub_objs, using):
+    """
+    On delete handler setting plans and meals creator as 'deleted' user, sentinel is not looked up
+    when deleted user has nothing to reassign.
+    """
+    if sub_objs:
+        collector.add_field_update(field, get_sentinel_user_id(), sub_objs)
 
 
 TYPES = (
@@ -26,7 +54,8 @@ class Plan(models.Model):
     """
     name = models.CharField(max_length=64)
     date_created = models.DateTimeField(auto_now_add=True)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET(get_sentinel_user))
+    date_used = models.DateTimeField(default=timezone.now, db_index=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=set_sentinel_user)
     meal = models.ManyToManyField('Meal', through='PlanMeal')
     type = models.IntegerField(choices=TYPES)
     persons = models.IntegerField()
@@ -46,6 +75,17 @@ class SelectedPlan(models.Model):
     active_plan = models.ForeignKey(Plan, on_delete=models.CASCADE, null=True)
 
 
+class PlanBoughtProduct(models.Model):
+    """
+    Model specifying products already bought from plan's shopping list.
+    """
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE)
+    product = models.ForeignKey('Product', on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ['plan', 'product']
+
+
 class FavouritePlan(models.Model):
     """
     Model specifying relations between User and its favourite plans.
@@ -61,6 +101,38 @@ class PlanMeal(models.Model):
     plan = models.ForeignKey(Plan, on_delete=models.CASCADE)
     meal = models.ForeignKey('Meal', on_delete=models.CASCADE)
 
+    class Meta:
+        unique_together = ['plan', 'meal']
+
+
+class ArchivedPlan(models.Model):
+    """
+    Model specifying plan unused for a long time, moved out of Plan table with the same id.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    name = models.CharField(max_length=64)
+    date_created = models.DateTimeField()
+    date_used = models.DateTimeField()
+    date_archived = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=set_sentinel_user)
+    type = models.IntegerField(choices=TYPES)
+    persons = models.IntegerField()
+    bought_product_ids = models.JSONField(default=list)
+
+    def __str__(self):
+        """
+        Function used to show archived plan by its name.
+        """
+        return self.name
+
+
+class ArchivedPlanMeal(models.Model):
+    """
+    Model specifying relations between archived plans and meals.
+    """
+    plan = models.ForeignKey(ArchivedPlan, on_delete=models.CASCADE)
+    meal = models.ForeignKey('Meal', on_delete=models.CASCADE)
+
 
 class Meal(models.Model):
     """
@@ -68,7 +140,7 @@ class Meal(models.Model):
     """
     name = models.CharField(max_length=64)
     date_created = models.DateTimeField(auto_now_add=True)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET(get_sentinel_user))
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=set_sentinel_user)
     recipe = models.TextField(blank=True)
     type = models.IntegerField(choices=TYPES)
     product = models.ManyToManyField('Product', through='MealProduct')
@@ -80,6 +152,33 @@ class Meal(models.Model):
         return self.name
 
 
+class SimilarMeal(models.Model):
+    """
+    Model specifying precomputed similarity between meals, based on their products.
+    """
+    meal = models.ForeignKey(Meal, on_delete=models.CASCADE, related_name='similar_meals')
+    similar = models.ForeignKey(Meal, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['-score']
+        unique_together = ['meal', 'similar']
+
+
+class MealBand(models.Model):
+    """
+    Model specifying LSH bucket of meal, one per band of MinHash signature of its products.
+    Meals sharing a bucket are candidates for similar meals.
+    """
+    meal = models.ForeignKey(Meal, on_delete=models.CASCADE)
+    band = models.SmallIntegerField()
+    key = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ['meal', 'band']
+        indexes = [models.Index(fields=['band', 'key'])]
+
+
 class FavouriteMeal(models.Model):
     """
     Model specifying relations between User and its favourite meals.
@@ -96,6 +195,9 @@ class MealProduct(models.Model):
     product = models.ForeignKey('Product', on_delete=models.CASCADE)
     grams = models.IntegerField(default=0)
 
+    class Meta:
+        unique_together = ['meal', 'product']
+
 
 class Product(models.Model):
     """
@@ -105,6 +207,7 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=5, decimal_places=2)
     kcal = models.IntegerField()
     type = models.ForeignKey('ProductType', on_delete=models.CASCADE)
+    package_grams = models.IntegerField(null=True, blank=True, verbose_name='Waga opakowania (g)')
 
     def __str__(self):
         """
@@ -124,3 +227,82 @@ class ProductType(models.Model):
         Function used to show product type by its name.
         """
         return self.name
+
+
+ACTIONS = (
+    ('create', 'create'),
+    ('update', 'update'),
+    ('delete', 'delete'),
+    ('archive', 'archive'),
+    ('restore', 'restore')
+)
+
+
+class ChangeLog(models.Model):
+    """
+    Model specifying append-only log of catalog changes, its id is the cursor of change feed.
+    """
+    model = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=7, choices=ACTIONS)
+    data = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['model', 'object_id']), models.Index(fields=['model', 'id'])]
+
+
+JOB_STATUSES = (
+    ('queued', 'queued'),
+    ('running', 'running'),
+    ('done', 'done'),
+    ('failed', 'failed')
+)
+
+
+class Job(models.Model):
+    """
+    Model specifying background job run by 'run_worker' command.
+    """
+    name = models.CharField(max_length=64)
+    kwargs = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    status = models.CharField(max_length=7, choices=JOB_STATUSES, default='queued')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    progress = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    result = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    error = models.TextField(blank=True)
+    run_after = models.DateTimeField(null=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_started = models.DateTimeField(null=True)
+    date_heartbeat = models.DateTimeField(null=True)
+    date_finished = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        """
+        Function used to show job by its name and status.
+        """
+        return f'{self.name} ({self.status})'
+
+    def set_progress(self, progress, total=None):
+        """
+        Function used by running job to save how much of its work is done.
+        """
+        self.progress = progress
+        if total is not None:
+            self.total = total
+        Job.objects.filter(id=self.id).update(progress=self.progress, total=self.total)
+
+
+class RateLimitBucket(models.Model):
+    """
+    Model specifying token bucket of rate limited client, see RateLimitMiddleware.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    tokens = models.FloatField()
+    updated = models.FloatField()
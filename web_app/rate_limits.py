@@ -0,0 +1,47 @@
+import math
+import time
+
+from django.conf import settings
+from django.db import IntegrityError
+
+from web_app import models as m
+
+# Token buckets are rows of RateLimitBucket table, shared by all processes. A token is taken by conditional
+# update of the row read before, so concurrent requests never take the same token, on any database.
+RATE_LIMIT_RETRIES = 5
+
+
+def take_token(key, burst, period):
+    """
+    Function used to take one token from bucket of given key. Bucket holds 'burst' tokens refilled evenly over
+    'period' seconds. Returns None if token was taken or number of seconds after which next token will be available.
+    """
+    rate = burst / period
+    for _ in range(RATE_LIMIT_RETRIES):
+        now = time.time()
+        bucket = m.RateLimitBucket.objects.filter(key=key).first()
+        if bucket is None:
+            try:
+                m.RateLimitBucket.objects.create(key=key, tokens=burst - 1, updated=now)
+                return None
+            except IntegrityError:
+                # Bucket was created by concurrent request.
+                continue
+        tokens = min(burst, bucket.tokens + max(0, now - bucket.updated) * rate)
+        if tokens < 1:
+            return math.ceil((1 - tokens) / rate)
+        if m.RateLimitBucket.objects.filter(id=bucket.id, tokens=bucket.tokens, updated=bucket.updated) \
+                .update(tokens=tokens - 1, updated=now):
+            return None
+    # Bucket kept changing under heavy concurrent traffic of the same client.
+    return 1
+
+
+def remove_full_buckets():
+    """
+    Function used to remove buckets which are full again, they are the same as missing ones.
+    Returns number of removed buckets.
+    """
+    period = max((limit['period'] for limit in getattr(settings, 'RATE_LIMITS', {}).values()), default=0)
+    removed, _ = m.RateLimitBucket.objects.filter(updated__lt=time.time() - period).delete()
+    return removed
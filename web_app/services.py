@@ -0,0 +1,275 @@
+import hashlib
+import json
+import math
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from web_app import changes
+from web_app import jobs
+from web_app import metrics
+from web_app import models as m
+
+
+def clone_plan(plan, user, name=None, type=None, persons=None):
+    """
+    Function used to copy specified plan with all its meals for given user.
+    Meals are copied with one bulk insert, so cost does not grow with number of queries.
+    """
+    with transaction.atomic():
+        new_plan = m.Plan.objects.create(name=name or plan.name,
+                                         user=user,
+                                         type=type or plan.type,
+                                         persons=persons or plan.persons)
+        meal_ids = m.PlanMeal.objects.filter(plan_id=plan.id).values_list('meal_id', flat=True)
+        m.PlanMeal.objects.bulk_create([m.PlanMeal(plan_id=new_plan.id, meal_id=meal_id)
+                                        for meal_id in meal_ids.iterator()], batch_size=500)
+        changes.record('PlanMeal', 'create', m.PlanMeal.objects.filter(plan_id=new_plan.id))
+    return new_plan
+
+
+FAVOURITES_CACHE_TIMEOUT = 60 * 60
+
+
+def _favourites_cache_key(kind, user_id):
+    return f'favourite_{kind}_ids:{user_id}'
+
+
+def favourite_meal_ids(user):
+    """
+    Function used to get set of ids of meals selected by user as favourite, cached per user.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    key = _favourites_cache_key('meal', user.id)
+    meal_ids = cache.get(key)
+    metrics.inc('cache_requests_total', {'cache': 'favourites', 'result': 'miss' if meal_ids is None else 'hit'})
+    if meal_ids is None:
+        meal_ids = frozenset(m.FavouriteMeal.meal.through.objects.filter(favouritemeal__user_id=user.id)
+                             .values_list('meal_id', flat=True))
+        cache.set(key, meal_ids, FAVOURITES_CACHE_TIMEOUT)
+    return meal_ids
+
+
+def favourite_plan_ids(user):
+    """
+    Function used to get set of ids of plans selected by user as favourite, cached per user.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    key = _favourites_cache_key('plan', user.id)
+    plan_ids = cache.get(key)
+    metrics.inc('cache_requests_total', {'cache': 'favourites', 'result': 'miss' if plan_ids is None else 'hit'})
+    if plan_ids is None:
+        plan_ids = frozenset(m.FavouritePlan.plan.through.objects.filter(favouriteplan__user_id=user.id)
+                             .values_list('plan_id', flat=True))
+        cache.set(key, plan_ids, FAVOURITES_CACHE_TIMEOUT)
+    return plan_ids
+
+
+def invalidate_favourites(user_id):
+    """
+    Function used to drop cached favourite meals and plans of user.
+    """
+    cache.delete_many([_favourites_cache_key('meal', user_id), _favourites_cache_key('plan', user_id)])
+
+
+def add_favourite_meal(user, meal_id):
+    """
+    Function used to save meal as user's favourite, favourites container is created if needed.
+    """
+    favourite_meals, _ = m.FavouriteMeal.objects.get_or_create(user=user)
+    favourite_meals.meal.add(meal_id)
+    invalidate_favourites(user.id)
+
+
+def remove_favourite_meal(user, meal_id):
+    """
+    Function used to remove meal from user's favourites.
+    """
+    m.FavouriteMeal.meal.through.objects.filter(favouritemeal__user=user, meal_id=meal_id).delete()
+    invalidate_favourites(user.id)
+
+
+def add_favourite_plan(user, plan_id):
+    """
+    Function used to save plan as user's favourite, favourites container is created if needed.
+    """
+    favourite_plans, _ = m.FavouritePlan.objects.get_or_create(user=user)
+    favourite_plans.plan.add(plan_id)
+    invalidate_favourites(user.id)
+
+
+def remove_favourite_plan(user, plan_id):
+    """
+    Function used to remove plan from user's favourites.
+    """
+    m.FavouritePlan.plan.through.objects.filter(favouriteplan__user=user, plan_id=plan_id).delete()
+    invalidate_favourites(user.id)
+
+
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def shopping_list(plan):
+    """
+    Function used to count products needed for the plan, see plans_shopping_list().
+    """
+    return plans_shopping_list([plan.id])
+
+
+def plans_shopping_list(plan_ids):
+    """
+    Function used to count products needed for all given plans. Grams of each product are summed over all meals
+    of all plans, each scaled by its plan persons, by one grouped query and rounded up to whole packages.
+    Products without package size are bought once per meal. Returns products and total cost.
+    """
+    products = (m.Product.objects.filter(mealproduct__meal__planmeal__plan__in=plan_ids)
+                .annotate(total_grams=Sum(F('mealproduct__grams') * F('mealproduct__meal__planmeal__plan__persons')),
+                          meal_count=Count('mealproduct'))
+                .select_related('type').order_by('type__name', 'name', 'id'))
+    cost = 0
+    products = list(products)
+    for product in products:
+        if product.package_grams and product.total_grams:
+            product.packages = math.ceil(product.total_grams / product.package_grams)
+            product.label = f'{product.packages} × {product.package_grams} g'
+        else:
+            product.packages = product.meal_count
+            product.label = f'{product.packages} szt.'
+        product.cost = product.packages * product.price
+        cost += product.cost
+    return products, cost
+
+
+def shopping_list_state(plan):
+    """
+    Function used to get plan's shopping list as {product_id: item}.
+    """
+    bought_product_ids = set(m.PlanBoughtProduct.objects.filter(plan=plan).values_list('product_id', flat=True))
+    products, _ = shopping_list(plan)
+    return {str(product.id): {'id': product.id,
+                              'name': product.name,
+                              'price': str(product.price),
+                              'label': product.label,
+                              'cost': str(product.cost),
+                              'bought': product.id in bought_product_ids}
+            for product in products}
+
+
+def shopping_list_delta(plan, version=None):
+    """
+    Function used to get changes of plan's shopping list since given version token.
+    Every returned state is remembered in cache by its token, unknown or expired token gives full list.
+    """
+    state = shopping_list_state(plan)
+    new_version = hashlib.sha1(json.dumps(state, sort_keys=True).encode()).hexdigest()[:16]
+    cache.set(f'shopping_list:{plan.id}:{new_version}', state, SHOPPING_LIST_CACHE_TIMEOUT)
+    old_state = cache.get(f'shopping_list:{plan.id}:{version}') if version else None
+    metrics.inc('cache_requests_total', {'cache': 'shopping_list', 'result': 'miss' if old_state is None else 'hit'})
+    if old_state is None:
+        return {'version': new_version, 'full': True, 'items': list(state.values()), 'removed': []}
+    return {'version': new_version,
+            'full': False,
+            'items': [item for key, item in state.items() if old_state.get(key) != item],
+            'removed': [int(key) for key in old_state.keys() - state.keys()]}
+
+
+def apply_delta(model, owner_field, owner_id, item_field, item_model, add_ids, remove_ids):
+    """
+    Function used to add and remove rows relating meal or plan to its items, in one transaction with
+    one bulk insert and one delete. Items already related or not existing are not added, rows added
+    by concurrent request are skipped by the unique constraint. Returns numbers of added and removed rows.
+    """
+    add_ids, remove_ids = set(add_ids) - set(remove_ids), set(remove_ids)
+    rows = model.objects.filter(**{owner_field: owner_id})
+    with transaction.atomic():
+        present_ids = set(rows.filter(**{f'{item_field}__in': add_ids}).values_list(item_field, flat=True))
+        new_ids = list(item_model.objects.filter(id__in=add_ids - present_ids).values_list('id', flat=True))
+        model.objects.bulk_create([model(**{owner_field: owner_id, item_field: item_id}) for item_id in new_ids],
+                                  batch_size=500, ignore_conflicts=True)
+        removed = list(rows.filter(**{f'{item_field}__in': remove_ids}))
+        # Per row change log receivers are switched off, the change log gets all rows with one insert below.
+        with changes.suppressed():
+            model.objects.filter(id__in=[row.id for row in removed]).delete()
+        changes.record(model.__name__, 'create', rows.filter(**{f'{item_field}__in': new_ids}))
+        changes.record(model.__name__, 'delete', removed)
+    return len(new_ids), len(removed)
+
+
+def update_meal_products(meal, add_ids=(), remove_ids=()):
+    """
+    Function used to add and remove products of meal, see apply_delta(). Similar meals are refreshed once by job.
+    """
+    added, removed = apply_delta(m.MealProduct, 'meal_id', meal.id, 'product_id', m.Product, add_ids, remove_ids)
+    if added or removed:
+        jobs.enqueue_on_commit('refresh_similar_meals', meal_id=meal.id)
+    return added, removed
+
+
+def update_plan_meals(plan, add_ids=(), remove_ids=()):
+    """
+    Function used to add and remove meals of plan, see apply_delta().
+    """
+    return apply_delta(m.PlanMeal, 'plan_id', plan.id, 'meal_id', m.Meal, add_ids, remove_ids)
+
+
+def set_meal_grams(meal, grams):
+    """
+    Function used to save grammage of many products of meal given as {MealProduct: grams}, with one bulk update
+    in a transaction. Only changed rows are saved and similar meals are refreshed once by job.
+    Returns number of changes.
+    """
+    changed = []
+    for meal_product, value in grams.items():
+        if meal_product.grams != value:
+            meal_product.grams = value
+            changed.append(meal_product)
+    if not changed:
+        return 0
+    with transaction.atomic():
+        m.MealProduct.objects.bulk_update(changed, ['grams'], batch_size=500)
+        changes.record('MealProduct', 'update', changed)
+        jobs.enqueue_on_commit('refresh_similar_meals', meal_id=meal.id)
+    return len(changed)
+
+
+USER_DELETE_CHUNK_SIZE = 500
+
+
+def user_object_count(user):
+    """
+    Function used to count plans and meals created by user, which are reassigned when user is deleted.
+    """
+    return m.Plan.objects.filter(user=user).count() + m.Meal.objects.filter(user=user).count()
+
+
+def disable_user(user):
+    """
+    Function used to block user account at once, before its data is reassigned and account deleted.
+    """
+    user.is_active = False
+    user.set_unusable_password()
+    user.save(update_fields=['is_active', 'password'])
+
+
+def delete_user(user_id, chunk_size=USER_DELETE_CHUNK_SIZE, progress=None):
+    """
+    Function used to delete user account. Plans and meals of the user are reassigned to 'deleted' user
+    by chunked updates, each in its own short transaction, then the account is deleted with what is left.
+    Optional progress function gets number of reassigned objects after each chunk.
+    """
+    done = 0
+    for model in (m.Plan, m.Meal):
+        objects = model.objects.filter(user_id=user_id)
+        while chunk_ids := list(objects.values_list('id', flat=True)[:chunk_size]):
+            with transaction.atomic():
+                model.objects.filter(id__in=chunk_ids).update(user_id=m.get_sentinel_user_id())
+                changes.record(model.__name__, 'update', model.objects.filter(id__in=chunk_ids))
+            done += len(chunk_ids)
+            if progress is not None:
+                progress(done)
+    User.objects.filter(id=user_id).delete()
+    return done
@@ -0,0 +1,194 @@
+from django.contrib.auth.models import Group, Permission, User
+from django.db.models import Q
+from django.core.cache import cache
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from web_app import backends
+from web_app import changes
+from web_app import jobs
+from web_app import metrics
+from web_app import models as m
+from web_app import services
+from web_app import slow_queries
+
+
+def schedule_similar_meals_refresh(meal_ids):
+    """
+    Function used to queue jobs recounting similar meals of changed meals after transaction commit.
+    """
+    for meal_id in set(meal_ids):
+        jobs.enqueue_on_commit('refresh_similar_meals', meal_id=meal_id)
+
+
+@receiver(m2m_changed, sender=m.MealProduct)
+def meal_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Refreshes similar meals when products are added to or removed from meal.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        schedule_similar_meals_refresh([instance.id])
+    elif pk_set:
+        schedule_similar_meals_refresh(pk_set)
+
+
+@receiver(post_save, sender=m.MealProduct)
+@receiver(post_delete, sender=m.MealProduct)
+def meal_product_saved(sender, instance, **kwargs):
+    """
+    Refreshes similar meals when product grammage in meal changes.
+    Code switching off change log receivers refreshes similar meals itself.
+    """
+    if not changes.is_suppressed():
+        schedule_similar_meals_refresh([instance.meal_id])
+
+
+@receiver(pre_delete, sender=m.Meal)
+def meal_deleted(sender, instance, **kwargs):
+    """
+    Recounts similar meals of meals which lose deleted meal from their similar meals.
+    """
+    schedule_similar_meals_refresh(m.SimilarMeal.objects.filter(similar=instance).values_list('meal_id', flat=True))
+
+
+def invalidate_favourites_of(model, instance, action, reverse, pk_set):
+    """
+    Function used to drop cached favourite ids of users whose favourites changed.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        services.invalidate_favourites(instance.user_id)
+    elif pk_set:
+        for user_id in model.objects.filter(id__in=pk_set).values_list('user_id', flat=True):
+            services.invalidate_favourites(user_id)
+
+
+@receiver(m2m_changed, sender=m.FavouriteMeal.meal.through)
+def favourite_meals_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drops cached favourite ids when user's favourite meals change.
+    """
+    invalidate_favourites_of(m.FavouriteMeal, instance, action, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=m.FavouritePlan.plan.through)
+def favourite_plans_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drops cached favourite ids when user's favourite plans change.
+    """
+    invalidate_favourites_of(m.FavouritePlan, instance, action, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drops cached permissions of users whose groups or own permissions change.
+    """
+    if reverse and action == 'pre_clear':
+        backends.invalidate_permissions(instance.user_set.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        backends.invalidate_permissions(pk_set if reverse else [instance.pk])
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drops cached permissions of all group members when group permissions change.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        backends.invalidate_permissions(instance.user_set.values_list('id', flat=True))
+    elif pk_set:
+        backends.invalidate_permissions(User.objects.filter(groups__in=pk_set).values_list('id', flat=True))
+    elif action == 'pre_clear':
+        backends.invalidate_permissions(User.objects.filter(groups__permissions=instance).values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Group)
+@receiver(pre_delete, sender=Permission)
+def group_or_permission_deleted(sender, instance, **kwargs):
+    """
+    Drops cached permissions of users who lose permissions with deleted group or permission.
+    Users are found before deletion and their cache is dropped again after commit.
+    """
+    if sender is Group:
+        user_ids = list(instance.user_set.values_list('id', flat=True))
+    else:
+        user_ids = list(User.objects.filter(Q(user_permissions=instance) | Q(groups__permissions=instance))
+                        .values_list('id', flat=True).distinct())
+    backends.invalidate_permissions(user_ids)
+    transaction.on_commit(lambda: backends.invalidate_permissions(user_ids))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_saved(sender, instance, **kwargs):
+    """
+    Drops cached permissions when user flags, such as is_superuser, may have changed.
+    """
+    backends.invalidate_permissions([instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def sentinel_user_deleted(sender, instance, **kwargs):
+    """
+    Drops cached id of 'deleted' user when the user itself is deleted.
+    """
+    if instance.username == 'deleted':
+        cache.delete(m.SENTINEL_USER_CACHE_KEY)
+
+
+def record_saved(sender, instance, created, raw=False, **kwargs):
+    """
+    Records created or updated catalog object in change log.
+    """
+    if not raw and not changes.is_suppressed():
+        changes.record(sender.__name__, 'create' if created else 'update', [instance])
+
+
+def record_deleted(sender, instance, **kwargs):
+    """
+    Records deleted catalog object in change log.
+    """
+    if not changes.is_suppressed():
+        changes.record(sender.__name__, 'delete', [instance])
+
+
+for model_name in changes.TRACKED_MODELS:
+    post_save.connect(record_saved, sender=getattr(m, model_name), dispatch_uid=f'changes_save_{model_name}')
+    post_delete.connect(record_deleted, sender=getattr(m, model_name), dispatch_uid=f'changes_delete_{model_name}')
+
+
+@receiver(m2m_changed, sender=m.MealProduct)
+@receiver(m2m_changed, sender=m.PlanMeal)
+def record_relations_added(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Records meal products and plan meals added with bulk insert by related manager.
+    Removed relations are recorded by post_delete signal.
+    """
+    if action != 'post_add' or not pk_set:
+        return
+    source, target = ('meal', 'product') if sender is m.MealProduct else ('plan', 'meal')
+    if reverse:
+        source, target = target, source
+    objects = sender.objects.filter(**{source: instance, f'{target}__in': pk_set})
+    changes.record(sender.__name__, 'create', objects)
+
+
+@receiver(post_save, sender=m.Plan)
+def plan_created(sender, instance, created, **kwargs):
+    """
+    Counts created plans for metrics.
+    """
+    if created:
+        metrics.inc('plans_created_total')
+
+
+connection_created.connect(slow_queries.install, dispatch_uid='slow_queries')
@@ -0,0 +1,183 @@
+import hashlib
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from web_app import models as m
+
+SIMILAR_MEALS_COUNT = getattr(settings, 'SIMILAR_MEALS_COUNT', 5)
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+_PRIME = (1 << 61) - 1
+_random = random.Random(2022)
+_COEFFICIENTS = [(_random.randrange(1, _PRIME), _random.randrange(0, _PRIME)) for _ in range(MINHASH_PERMUTATIONS)]
+
+
+def meal_vectors(meal_ids=None):
+    """
+    Function used to load products of meals as {meal_id: {product_id: grams}}.
+    Product without grams set counts as 1g, so such meals are compared by product set only.
+    """
+    rows = m.MealProduct.objects.order_by('meal_id')
+    if meal_ids is not None:
+        rows = rows.filter(meal_id__in=meal_ids)
+    vectors = defaultdict(dict)
+    for meal_id, product_id, grams in rows.values_list('meal_id', 'product_id', 'grams').iterator(chunk_size=2000):
+        vectors[meal_id][product_id] = vectors[meal_id].get(product_id, 0) + max(grams, 1)
+    return vectors
+
+
+def weighted_jaccard(first, second):
+    """
+    Function used to count weighted Jaccard similarity of two {product_id: grams} vectors.
+    """
+    products = first.keys() | second.keys()
+    top = sum(min(first.get(product, 0), second.get(product, 0)) for product in products)
+    bottom = sum(max(first.get(product, 0), second.get(product, 0)) for product in products)
+    return top / bottom if bottom else 0
+
+
+def minhash_signature(products):
+    """
+    Function used to count MinHash signature of product id set.
+    """
+    return tuple(min((a * product + b) % _PRIME for product in products) for a, b in _COEFFICIENTS)
+
+
+def band_keys(products):
+    """
+    Function used to get LSH buckets of product id set as (band, key) pairs, key is 64-bit hash of one band
+    of its MinHash signature.
+    """
+    rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+    signature = minhash_signature(products)
+    return {(band, int.from_bytes(hashlib.blake2b(repr(signature[band * rows:(band + 1) * rows]).encode(),
+                                                  digest_size=8).digest(), 'big', signed=True))
+            for band in range(MINHASH_BANDS)}
+
+
+def lsh_candidates(vectors):
+    """
+    Function used to find pairs of meals which probably share products, using MinHash with LSH banding.
+    """
+    buckets = defaultdict(list)
+    for meal_id, products in vectors.items():
+        for key in band_keys(products):
+            buckets[key].append(meal_id)
+    candidates = defaultdict(set)
+    for meal_ids in buckets.values():
+        for meal_id in meal_ids:
+            candidates[meal_id].update(meal_ids)
+    for meal_id, meal_ids in candidates.items():
+        meal_ids.discard(meal_id)
+    return candidates
+
+
+def save_bands(meal_id, products):
+    """
+    Function used to save LSH buckets of meal, meal without products has none.
+    """
+    m.MealBand.objects.filter(meal_id=meal_id).delete()
+    m.MealBand.objects.bulk_create([m.MealBand(meal_id=meal_id, band=band, key=key)
+                                    for band, key in (band_keys(products) if products else ())])
+
+
+def bucket_candidates(meal_id):
+    """
+    Function used to get ids of meals sharing at least one saved LSH bucket with given meal.
+    """
+    buckets = m.MealBand.objects.filter(meal_id=meal_id)
+    same_bucket = Q()
+    for band, key in buckets.values_list('band', 'key'):
+        same_bucket |= Q(band=band, key=key)
+    if not same_bucket:
+        return set()
+    return set(m.MealBand.objects.filter(same_bucket).exclude(meal_id=meal_id).values_list('meal_id', flat=True))
+
+
+def top_similar(meal_id, vector, candidates, vectors, count=SIMILAR_MEALS_COUNT):
+    """
+    Function used to pick best scored meals among candidates as SimilarMeal objects.
+    """
+    scored = []
+    for candidate in candidates:
+        score = weighted_jaccard(vector, vectors[candidate])
+        if score > 0:
+            scored.append((score, candidate))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [m.SimilarMeal(meal_id=meal_id, similar_id=candidate, score=score)
+            for score, candidate in scored[:count]]
+
+
+def rebuild_similar_meals(count=SIMILAR_MEALS_COUNT):
+    """
+    Function used to recount LSH buckets and similar meals of all meals in one batch.
+    """
+    vectors = meal_vectors()
+    candidates = lsh_candidates(vectors)
+    similar_meals = []
+    for meal_id, vector in vectors.items():
+        similar_meals.extend(top_similar(meal_id, vector, candidates[meal_id], vectors, count))
+    with transaction.atomic():
+        m.MealBand.objects.all().delete()
+        m.MealBand.objects.bulk_create([m.MealBand(meal_id=meal_id, band=band, key=key)
+                                        for meal_id, products in vectors.items()
+                                        for band, key in band_keys(products)], batch_size=1000)
+        m.SimilarMeal.objects.all().delete()
+        m.SimilarMeal.objects.bulk_create(similar_meals, batch_size=1000)
+    return len(similar_meals)
+
+
+def similar_meals_of(meal_id, count=SIMILAR_MEALS_COUNT):
+    """
+    Function used to recount similar meals of one meal among meals sharing LSH bucket with it.
+    """
+    candidate_ids = bucket_candidates(meal_id)
+    vectors = meal_vectors(candidate_ids | {meal_id})
+    return top_similar(meal_id, vectors.get(meal_id, {}), candidate_ids, vectors, count)
+
+
+def refresh_similar_meals(meal_id, count=SIMILAR_MEALS_COUNT):
+    """
+    Function used to recount LSH buckets and similar meals of one meal after its products changed, run by
+    'refresh_similar_meals' job. Candidates are meals sharing saved LSH bucket with it. Meal is also added to,
+    moved in or removed from similar meals of candidates and meals pointing at it, meals whose score for it
+    dropped are recounted, as another meal may take its place.
+    """
+    vector = meal_vectors([meal_id]).get(meal_id, {})
+    with transaction.atomic():
+        save_bands(meal_id, vector)
+    candidate_ids = bucket_candidates(meal_id)
+    affected_ids = candidate_ids | set(m.SimilarMeal.objects.filter(similar_id=meal_id)
+                                       .values_list('meal_id', flat=True))
+    vectors = meal_vectors(affected_ids | {meal_id})
+    current = defaultdict(list)
+    for similar_meal in m.SimilarMeal.objects.filter(meal_id__in=affected_ids):
+        current[similar_meal.meal_id].append(similar_meal)
+    added, updated, removed, recounted = [], [], [], []
+    for other_id in affected_ids:
+        score = weighted_jaccard(vectors.get(other_id, {}), vector) if other_id in candidate_ids else 0
+        similar_meals = current[other_id]
+        old = next((similar_meal for similar_meal in similar_meals if similar_meal.similar_id == meal_id), None)
+        if old is not None and score < old.score:
+            recounted.append(other_id)
+        elif old is not None:
+            old.score = score
+            updated.append(old)
+        elif score > 0:
+            ranked = sorted(similar_meals, key=lambda similar_meal: (-similar_meal.score, similar_meal.similar_id))
+            if len(ranked) < count or (-score, meal_id) < (-ranked[count - 1].score, ranked[count - 1].similar_id):
+                added.append(m.SimilarMeal(meal_id=other_id, similar_id=meal_id, score=score))
+                removed.extend(similar_meal.id for similar_meal in ranked[count - 1:])
+    with transaction.atomic():
+        m.SimilarMeal.objects.filter(meal_id=meal_id).delete()
+        m.SimilarMeal.objects.bulk_create(top_similar(meal_id, vector, candidate_ids, vectors, count))
+        m.SimilarMeal.objects.filter(id__in=removed).delete()
+        m.SimilarMeal.objects.bulk_create(added, batch_size=1000)
+        m.SimilarMeal.objects.bulk_update(updated, ['score'], batch_size=1000)
+        m.SimilarMeal.objects.filter(meal_id__in=recounted).delete()
+        for other_id in recounted:
+            m.SimilarMeal.objects.bulk_create(similar_meals_of(other_id, count))
@@ -0,0 +1,149 @@
+import json
+import logging
+import re
+import time
+import traceback
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+
+SLOW_QUERY_LOG_SIZE = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+EXPLAIN_PREFIXES = {'postgresql': 'EXPLAIN ', 'mysql': 'EXPLAIN ', 'sqlite': 'EXPLAIN QUERY PLAN '}
+PROJECT_DIR = str(Path(__file__).resolve().parent.parent)
+
+logger = logging.getLogger('web_app.slow_queries')
+logger.propagate = False
+logger.setLevel(logging.INFO)
+_handler = None
+
+
+def threshold():
+    return getattr(settings, 'SLOW_QUERY_THRESHOLD', None)
+
+
+def log_path():
+    return Path(getattr(settings, 'SLOW_QUERY_LOG', Path(settings.BASE_DIR) / 'slow_queries.log'))
+
+
+def get_logger():
+    """
+    Function used to get logger writing slow queries as JSON lines to rotating SLOW_QUERY_LOG file.
+    """
+    global _handler
+    path = str(log_path())
+    if _handler is None or _handler.baseFilename != path:
+        if _handler is not None:
+            logger.removeHandler(_handler)
+            _handler.close()
+        _handler = RotatingFileHandler(path, maxBytes=SLOW_QUERY_LOG_SIZE, backupCount=SLOW_QUERY_LOG_BACKUPS)
+        logger.addHandler(_handler)
+    return logger
+
+
+def normalize(sql):
+    """
+    Function used to replace literals in SQL with '?', so the same query with other values is grouped.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def call_site():
+    """
+    Function used to find first frame of project code which is not this module or Django.
+    """
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        if frame.filename.startswith(PROJECT_DIR) and not frame.filename.endswith('slow_queries.py') \
+                and '/django/' not in frame.filename:
+            return f'{frame.filename[len(PROJECT_DIR) + 1:]}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+def explain(connection, sql, params):
+    """
+    Function used to get query plan of SELECT query, returns None for other queries.
+    """
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor)
+    if prefix is None or not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+    except Exception as error:
+        return f'EXPLAIN failed: {error}'
+
+
+class SlowQueryLogger:
+    """
+    Database execute wrapper recording queries slower than SLOW_QUERY_THRESHOLD seconds with normalized SQL,
+    call site and captured EXPLAIN plan. Nothing is recorded when SLOW_QUERY_THRESHOLD is None.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            limit = threshold()
+            if limit is not None and duration >= limit and not self.explaining and not many:
+                self.record(sql, params, duration)
+
+    def record(self, sql, params, duration):
+        self.explaining = True
+        try:
+            plan = explain(self.connection, sql, params)
+        finally:
+            self.explaining = False
+        get_logger().info(json.dumps({'time': time.time(), 'duration': duration, 'sql': normalize(sql),
+                                      'site': call_site(), 'explain': plan}))
+
+
+def install(connection, **kwargs):
+    """
+    Function used to add slow query logger to database connection, connected to connection_created signal.
+    """
+    if threshold() is None:
+        return
+    if not any(isinstance(wrapper, SlowQueryLogger) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(SlowQueryLogger(connection))
+
+
+def summary(top=10, order='total'):
+    """
+    Function used to group recorded slow queries by normalized SQL, returns top groups sorted by total,
+    max or average duration or by count, with last call site and EXPLAIN plan of each group.
+    """
+    groups = {}
+    for record in read_log():
+        group = groups.setdefault(record['sql'], {'sql': record['sql'], 'count': 0, 'total': 0.0, 'max': 0.0,
+                                                  'sites': set()})
+        group['count'] += 1
+        group['total'] += record['duration']
+        group['max'] = max(group['max'], record['duration'])
+        group['sites'].add(record['site'])
+        group['explain'] = record['explain']
+    for group in groups.values():
+        group['average'] = group['total'] / group['count']
+    return sorted(groups.values(), key=lambda group: -group[order])[:top]
+
+
+def read_log():
+    """
+    Generator yielding recorded slow queries from log file and its rotated copies.
+    """
+    path = log_path()
+    paths = [Path(f'{path}.{number}') for number in range(SLOW_QUERY_LOG_BACKUPS, 0, -1)] + [path]
+    for path in paths:
+        if path.exists():
+            with open(path) as file:
+                for line in file:
+                    yield json.loads(line)
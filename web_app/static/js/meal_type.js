@@ -1,11 +0,0 @@
-const chosenMealType = document.querySelector('#chosenMealType');
-
-chosenMealType.addEventListener('change', function() {
-    document.querySelectorAll('#meal').forEach(function (meal) {
-        if (meal.attributes.type_id.value === chosenMealType.value) {
-            meal.style.display = ''
-        } else {
-            meal.style.display = 'none'
-        }
-    })
-})
\ No newline at end of file
@@ -0,0 +1,99 @@
+const picker = document.querySelector('#picker');
+
+function chosenIds(selector) {
+    return new Set(Array.from(document.querySelectorAll(selector)).map(function(checkbox) {
+        return checkbox.value;
+    }));
+}
+
+function saveDelta(event, initialIds) {
+    // Only added and removed items are sent, not the whole selection.
+    event.preventDefault();
+    const form = event.target;
+    const checkedIds = chosenIds('#picker input[type=checkbox]:checked, #chosen input[type=checkbox]:checked');
+    const data = new FormData();
+    checkedIds.forEach(function(id) {
+        if (!initialIds.has(id)) {
+            data.append('add', id);
+        }
+    });
+    initialIds.forEach(function(id) {
+        if (!checkedIds.has(id)) {
+            data.append('remove', id);
+        }
+    });
+    fetch(picker.dataset.deltaUrl, {
+        method: 'POST',
+        headers: {'X-CSRFToken': form.querySelector('[name=csrfmiddlewaretoken]').value},
+        body: data
+    }).then(function(response) {
+        if (response.ok) {
+            window.location = picker.dataset.next;
+        } else {
+            form.submit();
+        }
+    }).catch(function() {
+        form.submit();
+    });
+}
+
+function addResult(results, item) {
+    // Checked result is moved to chosen list, so it stays when results change.
+    const p = document.createElement('p');
+    const checkbox = document.createElement('input');
+    checkbox.type = 'checkbox';
+    checkbox.name = picker.dataset.name;
+    checkbox.value = item.id;
+    checkbox.addEventListener('change', function() {
+        if (checkbox.checked) {
+            document.querySelector('#chosen').appendChild(p);
+        }
+    });
+    const a = document.createElement('a');
+    a.href = picker.dataset.link + item.id;
+    a.textContent = item.name;
+    p.appendChild(checkbox);
+    p.append(' ');
+    p.appendChild(a);
+    if (item.price) {
+        const price = document.createElement('b');
+        price.textContent = item.price + ' zł';
+        p.append(', cena: ');
+        p.appendChild(price);
+    }
+    results.appendChild(p);
+}
+
+function searchPicker(query) {
+    // Only top matches are downloaded, the full catalog is never rendered.
+    return fetch(picker.dataset.url + '?q=' + encodeURIComponent(query)).then(function(response) {
+        return response.json();
+    }).then(function(data) {
+        if (query !== document.querySelector('#pickerInput').value) {
+            return;
+        }
+        const results = document.querySelector('#pickerResults');
+        const chosen = chosenIds('#chosen input[type=checkbox]');
+        results.innerHTML = '';
+        data.results.forEach(function(item) {
+            if (!chosen.has(String(item.id))) {
+                addResult(results, item);
+            }
+        });
+    }).catch(function() {});
+}
+
+if (picker) {
+    const initialIds = chosenIds('#chosen input[type=checkbox]');
+    picker.closest('form').addEventListener('submit', function(event) {
+        saveDelta(event, initialIds);
+    });
+    let timer = null;
+    document.querySelector('#pickerInput').addEventListener('input', function() {
+        const query = this.value;
+        clearTimeout(timer);
+        timer = setTimeout(function() {
+            searchPicker(query);
+        }, 200);
+    });
+}
@@ -1,9 +1,121 @@
-document.querySelectorAll('.list-group-item').forEach(function(button) {
-    button.addEventListener('click', function() {
-        if(this.parentElement.id === 'list1') {
-            document.querySelector('#list2').appendChild(button);
-        } else {
-            document.querySelector('#list1').appendChild(button);
+const productList = document.querySelector('#productList');
+const planId = productList.attributes.plan_id.value;
+const stateKey = 'shoppingList:' + planId;
+const pendingKey = 'shoppingListPending:' + planId;
+
+function loadJSON(key, empty) {
+    return JSON.parse(localStorage.getItem(key) || 'null') || empty;
+}
+
+function sendBought(productId, bought) {
+    const csrfToken = productList.querySelector('[name=csrfmiddlewaretoken]').value;
+    return fetch('/plans/product-list/' + planId + '/bought/' + productId, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json', 'X-CSRFToken': csrfToken},
+        body: JSON.stringify({'bought': bought})
+    })
+}
+
+function saveBought(productId, bought) {
+    // Changes made offline are queued and sent when connection comes back.
+    const pending = loadJSON(pendingKey, {});
+    pending[productId] = bought;
+    localStorage.setItem(pendingKey, JSON.stringify(pending));
+    return flushPending();
+}
+
+function dropPending(productId, bought) {
+    // Change made again while the request was running stays queued.
+    const left = loadJSON(pendingKey, {});
+    if (left[productId] === bought) {
+        delete left[productId];
+        localStorage.setItem(pendingKey, JSON.stringify(left));
+    }
+}
+
+function flushPending() {
+    // Saved change is dropped from the queue. Change rejected by server is dropped and moved back on the screen.
+    // After redirect to login, 429 or server error it stays queued and is sent again later.
+    const pending = loadJSON(pendingKey, {});
+    return Promise.all(Object.keys(pending).map(function(productId) {
+        const bought = pending[productId];
+        return sendBought(productId, bought).then(function(response) {
+            if (response.redirected || response.status === 429 || response.status >= 500) {
+                return;
+            }
+            dropPending(productId, bought);
+            if (!response.ok) {
+                moveProduct(productId, !bought);
+            }
+        });
+    })).catch(function() {});
+}
+
+function addItem(list, item) {
+    const li = document.createElement('li');
+    li.className = 'list-group-item list-group-item-action';
+    li.setAttribute('product_id', item.id);
+    li.textContent = item.name + ': ' + item.label + ', ' + item.cost + ' zł';
+    li.addEventListener('click', toggleProduct);
+    list.appendChild(li);
+}
+
+function renderList(items) {
+    const pending = loadJSON(pendingKey, {});
+    const list1 = document.querySelector('#list1');
+    const list2 = document.querySelector('#list2');
+    list1.innerHTML = '';
+    list2.innerHTML = '';
+    Object.values(items).forEach(function(item) {
+        const bought = item.id in pending ? pending[item.id] : item.bought;
+        addItem(bought ? list2 : list1, item);
+    })
+}
+
+function syncList() {
+    // Only products changed since the stored version are downloaded.
+    const state = loadJSON(stateKey, {'version': null, 'items': {}});
+    const query = state.version ? '?version=' + state.version : '';
+    return fetch('/plans/product-list/' + planId + '/sync' + query).then(function(response) {
+        return response.json();
+    }).then(function(delta) {
+        const items = delta.full ? {} : state.items;
+        delta.items.forEach(function(item) {
+            items[item.id] = item;
+        })
+        delta.removed.forEach(function(productId) {
+            delete items[productId];
+        })
+        localStorage.setItem(stateKey, JSON.stringify({'version': delta.version, 'items': items}));
+        if (state.version && (delta.full || delta.items.length || delta.removed.length)) {
+            renderList(items);
         }
+    }).catch(function() {});
+}
+
+function moveProduct(productId, bought) {
+    const target = document.querySelector(bought ? '#list2' : '#list1');
+    document.querySelectorAll('.list-group-item[product_id="' + productId + '"]').forEach(function(item) {
+        target.appendChild(item);
     })
-})
\ No newline at end of file
+}
+
+function toggleProduct() {
+    const productId = this.attributes.product_id.value;
+    const bought = this.parentElement.id === 'list1';
+    moveProduct(productId, bought);
+    saveBought(productId, bought);
+}
+
+document.querySelectorAll('.list-group-item').forEach(function(button) {
+    button.addEventListener('click', toggleProduct);
+})
+
+window.addEventListener('online', function() {
+    flushPending().then(syncList);
+})
+
+if ('serviceWorker' in navigator) {
+    navigator.serviceWorker.register('/sw.js');
+}
+flushPending().then(syncList);
@@ -0,0 +1,44 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.svg', '.txt', '.html', '.json', '.xml')
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Static files storage fingerprinting files with content hash and writing precompressed
+    .gz and .br (when brotli is installed) siblings of text files during collectstatic.
+    """
+    def post_process(self, paths, dry_run=False, **options):
+        processed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                processed_names.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in sorted(processed_names):
+            if name.endswith(COMPRESSED_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name):
+        """
+        Saves gzip and brotli versions of the file, only if they are smaller than original.
+        """
+        with self.open(name) as file:
+            content = file.read()
+        variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content)))
+        for extension, compressed in variants:
+            if len(compressed) < len(content):
+                if self.exists(name + extension):
+                    self.delete(name + extension)
+                self._save(name + extension, ContentFile(compressed))
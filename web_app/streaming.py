@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+STREAM_CHUNK_SIZE = getattr(settings, 'STREAM_CHUNK_SIZE', 500)
+ROWS_MARKER = '<!-- streamed rows -->'
+
+
+def stream_rows(head, tail, row_template, row_name, row_context, queryset, chunk_size):
+    """
+    Generator yielding page head, rows rendered in chunks read with queryset.iterator() and page tail.
+    """
+    yield head
+    rows = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        rows.append(row_template.render({**row_context, row_name: obj}))
+        if len(rows) >= chunk_size:
+            yield ''.join(rows)
+            rows = []
+    yield ''.join(rows) + tail
+
+
+def stream_list(request, template_name, context, row_template_name, row_name, queryset, row_context=None,
+                chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Function used to render very large list page as streamed response. Template is rendered with
+    'streaming' flag, it should put ROWS_MARKER instead of its rows loop. Response is gzipped on the fly
+    if browser accepts it, so memory usage and time to first byte don't depend on number of rows.
+    """
+    page = render_to_string(template_name, {**context, 'streaming': True, 'rows_marker': ROWS_MARKER}, request)
+    head, tail = page.split(ROWS_MARKER, 1)
+    rows = stream_rows(head, tail, get_template(row_template_name), row_name, row_context or {}, queryset,
+                       chunk_size)
+    content = (chunk.encode() for chunk in rows)
+    compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+    if compress:
+        content = compress_sequence(content)
+    response = StreamingHttpResponse(content, content_type='text/html; charset=utf-8')
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
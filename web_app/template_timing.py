@@ -0,0 +1,137 @@
+import functools
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from django.template import engines
+from django.template.base import Template
+
+# Per-request stats: {'template', 'filter' or 'tag': {name: [calls, seconds]}}
+timings = ContextVar('template_timings', default=None)
+_depth = ContextVar('template_depth', default=0)
+_installed = False
+# Original Template._render and (filters or tags dict, name, function) of every wrapped filter and tag.
+_originals = []
+
+
+def new_timings():
+    return {'template': defaultdict(lambda: [0, 0.0]), 'filter': defaultdict(lambda: [0, 0.0]),
+            'tag': defaultdict(lambda: [0, 0.0]), 'total': 0.0}
+
+
+def add_timing(kind, name, seconds):
+    stats = timings.get()
+    if stats is not None:
+        stats[kind][name][0] += 1
+        stats[kind][name][1] += seconds
+
+
+def timed_filter(name, function):
+    """
+    Function used to wrap template filter, so its calls and time are counted.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if timings.get() is None:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            add_timing('filter', name, time.perf_counter() - start)
+    return wrapper
+
+
+def timed_tag(name, compile_function):
+    """
+    Function used to wrap template tag compile function, so render time of its nodes is counted.
+    """
+    @functools.wraps(compile_function)
+    def wrapper(parser, token):
+        node = compile_function(parser, token)
+        render = node.render
+
+        def timed_render(context):
+            if timings.get() is None:
+                return render(context)
+            start = time.perf_counter()
+            try:
+                return render(context)
+            finally:
+                add_timing('tag', name, time.perf_counter() - start)
+        node.render = timed_render
+        return node
+    return wrapper
+
+
+def timed_template_render(render):
+    """
+    Function used to wrap Template._render, time of each template is inclusive, total counts only
+    outermost templates.
+    """
+    @functools.wraps(render)
+    def wrapper(self, context):
+        if timings.get() is None:
+            return render(self, context)
+        depth = _depth.set(_depth.get() + 1)
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            seconds = time.perf_counter() - start
+            _depth.reset(depth)
+            add_timing('template', self.name or '<string>', seconds)
+            if _depth.get() == 0:
+                timings.get()['total'] += seconds
+    return wrapper
+
+
+def install():
+    """
+    Function used to wrap template rendering and every registered filter and tag. Must be called before
+    templates are compiled.
+    """
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    _originals.append((Template, '_render', Template._render))
+    Template._render = timed_template_render(Template._render)
+    for engine in engines.all():
+        engine = getattr(engine, 'engine', None)
+        if engine is None:
+            continue
+        libraries = list(engine.template_builtins) + list(engine.template_libraries.values())
+        for library in libraries:
+            for name, function in library.filters.items():
+                _originals.append((library.filters, name, function))
+                library.filters[name] = timed_filter(name, function)
+            for name, function in library.tags.items():
+                _originals.append((library.tags, name, function))
+                library.tags[name] = timed_tag(name, function)
+
+
+def uninstall():
+    """
+    Function used to restore template rendering, filters and tags wrapped by install(). Templates compiled
+    in the meantime keep wrapped filters and tags, which are not timed outside of TemplateTimingMiddleware.
+    """
+    global _installed
+    for target, name, function in reversed(_originals):
+        if isinstance(target, dict):
+            target[name] = function
+        else:
+            setattr(target, name, function)
+    _originals.clear()
+    _installed = False
+
+
+def server_timing(stats):
+    """
+    Function used to format request stats as Server-Timing header value.
+    """
+    entries = [f'tpl;dur={stats["total"] * 1000:.2f};desc="templates"']
+    for kind in ('filter', 'tag'):
+        for name, (calls, seconds) in sorted(stats[kind].items(), key=lambda item: -item[1][1]):
+            entries.append(f'{kind}-{name};dur={seconds * 1000:.2f};desc="{calls} calls"')
+    return ', '.join(entries)
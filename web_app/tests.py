@@ -1,7 +1,33 @@
+import io
+import gzip
+import json
+import re
+import subprocess
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+import tracemalloc
+from datetime import timedelta
 import pytest
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User, Permission, Group
+from django.core.management import call_command
+from django.template import engines
 from django.urls import reverse
+from django.utils import timezone
+from web_app import autocomplete
+from web_app import jobs
+from web_app import metrics
+from web_app import rate_limits
+from web_app import similarity
+from web_app import slow_queries
+from web_app import template_timing
 from web_app import models as m
+from web_app import services as s
 
 
 @pytest.fixture
@@ -218,6 +244,25 @@ def test_user_delete_view(client, user):
     assert count_after_delete == count_before_delete - 1
 
 
+@pytest.mark.django_db
+def test_cached_permissions(client, user, group):
+    client.force_login(user)
+    url = reverse('user_favourite_meals')
+    assert client.get(url).status_code == 200
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get(url).status_code == 200
+    # Session, user and favourite meals only, permissions come from the cache without any query.
+    assert [query['sql'].split('"')[1] for query in queries] == ['django_session', 'auth_user', 'web_app_meal']
+
+    group.permissions.remove(Permission.objects.get(codename='view_favouritemeal'))
+    assert client.get(url).status_code == 403
+
+    group.permissions.add(Permission.objects.get(codename='view_favouritemeal'))
+    assert client.get(url).status_code == 200
+    group.delete()
+    assert client.get(url).status_code == 403
+
+
 @pytest.mark.django_db
 def test_plan_list_view(client, plans):
     url = reverse('plans')
@@ -287,6 +332,24 @@ def test_plan_delete_view(client, user, plan):
     assert count_after_delete == count_before_delete - 1
 
 
+@pytest.mark.django_db
+def test_plan_clone_view(client, user, plan, meals):
+    client.force_login(user)
+    plan.meal.set(meals)
+    url = reverse('plan_clone', args=(plan.id,))
+    get_response = client.get(url)
+    assert get_response.status_code == 200
+
+    data = {'name': 'clonedplan', 'type': 2, 'persons': 4}
+    count_before_clone = m.Plan.objects.count()
+    post_response = client.post(url, data)
+    count_after_clone = m.Plan.objects.count()
+    cloned_plan = m.Plan.objects.get(**data)
+    assert post_response.status_code in (200, 302)
+    assert count_after_clone == count_before_clone + 1
+    assert list(cloned_plan.meal.all()) == list(plan.meal.all())
+
+
 @pytest.mark.django_db
 def test_plan_meal_add_view(client, user, plan, meals):
     client.force_login(user)
@@ -321,6 +384,20 @@ def test_meal_list_view(client):
     assert list(get_response.context.get('meals')) == list(meals)
 
 
+@pytest.mark.django_db
+def test_meal_list_view_streaming(client, meals):
+    url = reverse('meals')
+    get_response = client.get(url, {'stream': 1})
+    content = b''.join(get_response.streaming_content).decode()
+    assert get_response.status_code == 200
+    assert content.count('id="meal"') == 3
+    assert content.index('id="myUL"') < content.rindex('testmeal3') < content.index('</html>')
+
+    get_response = client.get(url, {'stream': 1}, HTTP_ACCEPT_ENCODING='gzip')
+    assert get_response['Content-Encoding'] == 'gzip'
+    assert 'testmeal2' in gzip.decompress(b''.join(get_response.streaming_content)).decode()
+
+
 @pytest.mark.django_db
 def test_meal_details_view(client, meal, products):
     url = reverse('meal_details', args=(meal.id,))
@@ -331,6 +408,55 @@ def test_meal_details_view(client, meal, products):
     assert list(get_response.context.get('products')) == list(products)
 
 
+@pytest.mark.django_db
+def test_meal_details_similar_meals(client, meals, products, django_capture_on_commit_callbacks):
+    meal1, meal2, meal3 = meals
+    with django_capture_on_commit_callbacks(execute=True):
+        meal1.product.set(products)
+        meal2.product.set(products[:2])
+    assert m.Job.objects.filter(name='refresh_similar_meals', status='queued').count() == 2
+    jobs.work(once=True)
+    url = reverse('meal_details', args=(meal1.id,))
+    get_response = client.get(url)
+    similar_meals = list(get_response.context.get('similar_meals'))
+    assert [similar_meal.similar for similar_meal in similar_meals] == [meal2]
+    assert similar_meals[0].score == pytest.approx(2 / 3)
+
+
+@pytest.mark.django_db
+def test_refresh_similar_meals_updates_other_meals(meals, products, django_capture_on_commit_callbacks):
+    meal1, meal2, meal3 = meals
+
+    def similar_meals():
+        return {(similar_meal.meal_id, similar_meal.similar_id, round(similar_meal.score, 6))
+                for similar_meal in m.SimilarMeal.objects.all()}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        meal2.product.set(products[:2])
+        meal3.product.set(products[:1])
+    jobs.work(once=True)
+    with django_capture_on_commit_callbacks(execute=True):
+        meal1.product.set(products)
+    jobs.work(once=True)
+    assert m.SimilarMeal.objects.filter(meal=meal2, similar=meal1).exists()
+    for change in (products[1:], products[2:], []):
+        with django_capture_on_commit_callbacks(execute=True):
+            meal1.product.set(change)
+        jobs.work(once=True)
+        incremental = similar_meals()
+        similarity.rebuild_similar_meals()
+        assert incremental == similar_meals()
+    with django_capture_on_commit_callbacks(execute=True):
+        meal1.product.set(products)
+    jobs.work(once=True)
+    with django_capture_on_commit_callbacks(execute=True):
+        meal3.delete()
+    jobs.work(once=True)
+    incremental = similar_meals()
+    similarity.rebuild_similar_meals()
+    assert incremental == similar_meals() != set()
+
+
 @pytest.mark.django_db
 def test_meal_add_view(client, user):
     client.force_login(user)
@@ -393,6 +519,10 @@ def test_meal_plan_add_view(client, user, meal, plans):
     post_response = client.post(url, data)
     assert post_response.status_code in (200, 302)
     assert m.PlanMeal.objects.filter(meal_id=meal.id).count() == 3
+    other_plan = m.Plan.objects.create(name='otherplan', user=User.objects.create(username='other'), type=1,
+                                       persons=1)
+    assert client.post(url, {'plan': [plans[0].id, other_plan.id]}).status_code == 200
+    assert m.PlanMeal.objects.filter(meal_id=meal.id).count() == 3
 
 
 @pytest.mark.django_db
@@ -631,6 +761,21 @@ def test_user_favourite_meal_add_view(client, user, meal):
     assert count_after_add == count_before_add + 1
 
 
+@pytest.mark.django_db
+def test_meal_details_is_favourite(client, user, meal):
+    client.force_login(user)
+    url = reverse('meal_details', args=(meal.id,))
+    assert client.get(url).context.get('is_favourite') is False
+
+    client.get(reverse('user_favourite_meal_add', args=(meal.id,)))
+    assert client.get(url).context.get('is_favourite') is True
+    s.invalidate_favourites(user.id)
+    for expected in (1, 0):
+        with CaptureQueriesContext(connection) as queries:
+            assert s.favourite_meal_ids(user) == {meal.id}
+        assert len([query for query in queries if 'web_app_favouritemeal' in query['sql']]) == expected
+
+
 @pytest.mark.django_db
 def test_user_favourite_meal_delete_view(client, user, meal, favouritemeal):
     client.force_login(user)
@@ -669,3 +814,537 @@ def test_plan_product_list_view(client, plan, meal, planmeal, products):
     assert get_response.status_code == 200
     assert get_response.context.get('plan') == plan
     assert list(get_response.context.get('products')) == list(products)
+
+
+def test_precompressed_static_middleware(client, settings, tmp_path):
+    settings.STATIC_ROOT = tmp_path
+    (tmp_path / 'script.0123456789ab.js').write_text('console.log(1);')
+    (tmp_path / 'script.0123456789ab.js.gz').write_bytes(b'gzipped')
+    response = client.get('/static/script.0123456789ab.js', HTTP_ACCEPT_ENCODING='gzip, deflate')
+    assert response.status_code == 200
+    assert response['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response['Cache-Control']
+    assert b''.join(response.streaming_content) == b'gzipped'
+
+    response = client.get('/static/script.0123456789ab.js')
+    assert 'Content-Encoding' not in response
+    assert b''.join(response.streaming_content) == b'console.log(1);'
+
+
+@pytest.mark.django_db
+def test_plan_product_bought_view(client, user, group, plan, meal, planmeal, products):
+    client.force_login(user)
+    meal.product.set(products)
+    product = products[0]
+    url = reverse('plan_product_bought', args=(plan.id, product.id))
+    post_response = client.post(url, {'bought': True}, content_type='application/json')
+    assert post_response.status_code == 204
+    get_response = client.get(reverse('plan_products', args=(plan.id,)))
+    assert get_response.context.get('bought_product_ids') == {product.id}
+
+    post_response = client.post(url, {'bought': False}, content_type='application/json')
+    assert post_response.status_code == 204
+    assert m.PlanBoughtProduct.objects.filter(plan=plan).count() == 0
+
+    other_product = m.Product.objects.create(name='other', price=1, kcal=1, type=product.type)
+    other_url = reverse('plan_product_bought', args=(plan.id, other_product.id))
+    assert client.post(other_url, {'bought': True}, content_type='application/json').status_code == 400
+    missing_url = reverse('plan_product_bought', args=(plan.id, 99999))
+    assert client.post(missing_url, {'bought': True}, content_type='application/json').status_code == 404
+    other_user = User.objects.create(username='other')
+    other_user.groups.add(group)
+    client.force_login(other_user)
+    post_response = client.post(url, {'bought': True}, content_type='application/json')
+    assert post_response.status_code == 403
+    assert post_response.content.decode() == 'Nie możesz edytować czyjegoś planu.'
+    assert m.PlanBoughtProduct.objects.filter(plan=plan).count() == 0
+
+
+@pytest.mark.django_db
+def test_plan_product_list_sync_view(client, plan, meal, planmeal, products):
+    meal.product.set(products)
+    url = reverse('plan_products_sync', args=(plan.id,))
+    full = client.get(url).json()
+    assert full['full'] is True
+    assert len(full['items']) == 3
+
+    product = products[0]
+    product.price = 99
+    product.save()
+    meal.product.remove(products[1])
+    delta = client.get(url, {'version': full['version']}).json()
+    assert delta['full'] is False
+    assert [item['id'] for item in delta['items']] == [product.id]
+    assert delta['removed'] == [products[1].id]
+
+    unchanged = client.get(url, {'version': delta['version']}).json()
+    assert unchanged['items'] == unchanged['removed'] == []
+
+
+@pytest.mark.django_db
+def test_service_worker_view(client):
+    response = client.get(reverse('service_worker'))
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'application/javascript'
+
+
+@pytest.mark.django_db
+def test_change_log_compacted_by_job(product, monkeypatch, django_capture_on_commit_callbacks):
+    monkeypatch.setattr('web_app.changes.CHANGE_LOG_COMPACT_EVERY', 5)
+    with django_capture_on_commit_callbacks(execute=True):
+        for price in range(1, 11):
+            product.price = price
+            product.save()
+    assert m.ChangeLog.objects.filter(model='Product', object_id=product.id).count() == 11
+    assert m.Job.objects.filter(name='compact_changes', status='queued').count() == 1
+    m.ChangeLog.objects.update(date_created=timezone.now() - timedelta(days=60))
+    jobs.work(once=True)
+    assert m.ChangeLog.objects.filter(model='Product', object_id=product.id).count() == 1
+
+
+@pytest.mark.django_db
+def test_change_feed_view(client, meal, products, monkeypatch):
+    monkeypatch.setattr('web_app.changes.CHANGE_FEED_LAG', timedelta(0))
+    url = reverse('changes')
+    cursor = client.get(url).json()['cursor']
+    meal.product.set(products)
+    meal.product.remove(products[0])
+    feed = client.get(url, {'since': cursor}).json()
+    assert [(change['model'], change['action']) for change in feed['changes']] == \
+        [('MealProduct', 'create')] * 3 + [('MealProduct', 'delete')]
+    assert feed['has_more'] is False
+    assert client.get(url, {'since': feed['cursor']}).json()['changes'] == []
+    assert len(client.get(url, {'since': cursor, 'limit': 0}).json()['changes']) == 1
+    assert len(client.get(url, {'since': cursor, 'limit': -5}).json()['changes']) == 1
+    monkeypatch.setattr('web_app.changes.CHANGE_FEED_LAG', timedelta(minutes=1))
+    assert client.get(url, {'since': cursor}).json() == {'changes': [], 'cursor': cursor, 'has_more': False}
+
+
+@pytest.mark.django_db
+def test_export_import_catalog(tmp_path, user, planmeal, mealproduct, favouritemeal):
+    m.PlanBoughtProduct.objects.create(plan=planmeal.plan, product=mealproduct.product)
+    old_plan = m.Plan.objects.create(name='oldplan', user=user, type=1, persons=1)
+    old_plan.meal.add(planmeal.meal)
+    m.PlanBoughtProduct.objects.create(plan=old_plan, product=mealproduct.product)
+    m.Plan.objects.filter(id=old_plan.id).update(date_used=timezone.now() - timedelta(days=400))
+    call_command('archive_plans', days=365, stdout=io.StringIO())
+    archived_plan = m.ArchivedPlan.objects.get()
+    call_command('export_catalog', tmp_path, stdout=io.StringIO())
+    meal = m.Meal.objects.get()
+    m.Plan.objects.all().delete()
+    m.ArchivedPlan.objects.all().delete()
+    m.Meal.objects.all().delete()
+    m.ProductType.objects.all().delete()
+    m.FavouriteMeal.objects.all().delete()
+
+    call_command('import_catalog', tmp_path, batch_size=1, stdout=io.StringIO())
+    assert m.Meal.objects.get().date_created == meal.date_created
+    assert m.MealProduct.objects.get().grams == 100
+    assert m.PlanMeal.objects.count() == 1
+    assert list(m.FavouriteMeal.objects.get().meal.all()) == [meal]
+    assert m.PlanBoughtProduct.objects.get().plan_id == planmeal.plan_id
+    imported_plan = m.ArchivedPlan.objects.get()
+    assert (imported_plan.id, imported_plan.date_archived) == (archived_plan.id, archived_plan.date_archived)
+    assert imported_plan.bought_product_ids == [mealproduct.product_id]
+    assert list(imported_plan.archivedplanmeal_set.values_list('meal_id', flat=True)) == [meal.id]
+
+
+@pytest.mark.django_db
+def test_jobs_run_with_retries(superuser, products, producttype):
+    job = jobs.enqueue('change_product_prices', percent=10, product_type_id=producttype.id)
+    failing = jobs.enqueue('delete_product_type', max_attempts=1, product_type_id='wrong')
+    call_command('run_worker', once=True)
+    job.refresh_from_db()
+    failing.refresh_from_db()
+    assert (job.status, job.progress, job.total) == ('done', 3, 3)
+    assert {product.price for product in m.Product.objects.all()} == {11}
+    assert failing.status == 'failed'
+    assert failing.attempts == 1
+
+
+@pytest.mark.django_db
+def test_jobs_retry_with_backoff(monkeypatch):
+    def failing_task(job):
+        raise ValueError('failure')
+
+    monkeypatch.setitem(jobs.TASKS, 'failing', failing_task)
+    job = jobs.enqueue('failing', max_attempts=2)
+    before = timezone.now()
+    jobs.work(once=True)
+    job.refresh_from_db()
+    assert (job.status, job.attempts) == ('queued', 1)
+    assert job.run_after >= before + timedelta(seconds=jobs.JOB_RETRY_DELAY)
+    assert 'ValueError' in job.error
+    jobs.work(once=True)
+    job.refresh_from_db()
+    assert job.attempts == 1
+    m.Job.objects.filter(id=job.id).update(run_after=timezone.now())
+    jobs.work(once=True)
+    job.refresh_from_db()
+    assert (job.status, job.attempts) == ('failed', 2)
+
+
+@pytest.mark.django_db
+def test_jobs_lost_by_worker_are_requeued(superuser, products, producttype):
+    old = timezone.now() - timedelta(seconds=jobs.JOB_LEASE_TIMEOUT + 1)
+    job = jobs.enqueue('change_product_prices', percent=10, product_type_id=producttype.id)
+    spent = jobs.enqueue('change_product_prices', max_attempts=1, percent=10, product_type_id=producttype.id)
+    m.Job.objects.update(status='running', attempts=1, date_started=old, date_heartbeat=old)
+    jobs.work(once=True)
+    job.refresh_from_db()
+    spent.refresh_from_db()
+    assert (job.status, job.attempts) == ('done', 2)
+    assert spent.status == 'failed'
+    assert 'Worker stopped' in spent.error
+    assert {product.price for product in m.Product.objects.all()} == {11}
+
+
+@pytest.mark.django_db
+def test_plan_product_list_packages(client, plan, meals, products):
+    plan.persons = 2
+    plan.save()
+    plan.meal.set(meals)
+    product = products[0]
+    product.package_grams = 500
+    product.save()
+    for meal in meals:
+        m.MealProduct.objects.create(meal=meal, product=product, grams=100)
+    get_response = client.get(reverse('plan_products', args=(plan.id,)))
+    [listed] = get_response.context.get('products')
+    assert (listed.total_grams, listed.packages, listed.cost) == (600, 2, 20)
+    assert get_response.context.get('cost') == 20
+
+
+@pytest.mark.django_db
+def test_plans_product_list_view(client, user, plans, meal, products, favouriteplan):
+    client.force_login(user)
+    meal.product.set(products)
+    for plan in plans:
+        plan.meal.add(meal)
+    url = reverse('plans_products')
+    get_response = client.get(url, {'plan': [plan.id for plan in plans[:2]], 'favourites': 1})
+    assert get_response.status_code == 200
+    assert len(get_response.context.get('plans')) == 3
+    assert [product.packages for product in get_response.context.get('products')] == [3, 3, 3]
+    assert get_response.context.get('cost') == 90
+
+
+@pytest.mark.django_db
+def test_profiler_middleware(client, superuser, meal, settings, tmp_path):
+    settings.PROFILE_DIR = tmp_path
+    client.force_login(superuser)
+    url = reverse('meals')
+    assert 'X-Profile-URL' not in client.get(url)
+
+    get_response = client.get(url, {'_profile': 1})
+    profile_url = get_response['X-Profile-URL']
+    assert profile_url.encode() in get_response.content
+    profile_response = client.get(profile_url)
+    assert profile_response.status_code == 200
+    assert 'kcal_count' in profile_response.content.decode()
+
+
+@pytest.mark.django_db
+def test_profile_template_tags_section(client, superuser, plan, settings, tmp_path):
+    settings.PROFILE_DIR = tmp_path
+    client.force_login(superuser)
+    profile_url = client.get(reverse('plans'), {'_profile': 1})['X-Profile-URL']
+    content = client.get(profile_url).content.decode()
+    section = content.split('Filtry i tagi szablonów</h5>')[1].split('</pre>')[0]
+    assert 'plan_cost' in section
+
+
+@pytest.mark.django_db
+def test_memory_tracking(client, meals, settings, tmp_path):
+    settings.MEMORY_TRACKING = True
+    settings.MEMORY_TRACKING_LOG = tmp_path / 'memory.log'
+    try:
+        client.get(reverse('meals'))
+    finally:
+        tracemalloc.stop()
+    output = io.StringIO()
+    call_command('memory_report', stdout=output)
+    assert output.getvalue().startswith('meals: 1 zapytań')
+
+
+@pytest.mark.django_db
+def test_template_timing(client, meals, settings):
+    settings.TEMPLATE_TIMING = True
+    for loader in engines['django'].engine.template_loaders:
+        loader.reset()
+    try:
+        response = client.get(reverse('meals'))
+    finally:
+        template_timing.uninstall()
+        for loader in engines['django'].engine.template_loaders:
+            loader.reset()
+    assert 'tpl;dur=' in response['Server-Timing']
+    assert 'filter-kcal_count;' in response['Server-Timing']
+    assert 'desc="6 calls"' in response['Server-Timing']
+
+
+@pytest.mark.django_db
+def test_metrics_view(client, user, plan, meals, settings, tmp_path):
+    settings.METRICS_DIR = tmp_path
+    finished = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+    stale = tmp_path / f'{finished.stdout.strip()}.json'
+    stale.write_text(json.dumps({'counters': {metrics._key('plans_created_total', None): 1000}, 'histograms': {},
+                                 'users': {'999999': time.time()}}))
+    assert metrics.fold_stale_files() == 1
+    assert not stale.exists()
+    assert metrics.fold_stale_files() == 0
+    client.force_login(user)
+    client.get(reverse('plan_meal_random_add', args=(plan.id,)))
+    content = client.get(reverse('metrics')).content.decode()
+    assert 'http_request_duration_seconds_bucket{view="plan_meal_random_add",le="+Inf"}' in content
+    assert 'db_queries_per_request_count{view="plan_meal_random_add"}' in content
+    assert re.search(r'^random_meals_added_total [1-9]', content, re.M)
+    assert float(re.search(r'^plans_created_total (\S+)', content, re.M).group(1)) > 1000
+    assert re.search(r'^active_users [1-9]', content, re.M)
+    assert json.loads((tmp_path / metrics.AGGREGATE_FILE).read_text())['users'] == {}
+
+
+@pytest.mark.django_db
+def test_slow_queries(client, meals, settings, tmp_path):
+    settings.SLOW_QUERY_THRESHOLD = 0
+    settings.SLOW_QUERY_LOG = tmp_path / 'slow_queries.log'
+    slow_queries.install(connection)
+    try:
+        client.get(reverse('meals'))
+    finally:
+        connection.execute_wrappers[:] = [wrapper for wrapper in connection.execute_wrappers
+                                          if not isinstance(wrapper, slow_queries.SlowQueryLogger)]
+    output = io.StringIO()
+    call_command('slow_queries', '--explain', stdout=output)
+    assert 'FROM "web_app_meal"' in output.getvalue()
+    assert 'web_app/views.py:' in output.getvalue()
+    assert 'SCAN' in output.getvalue()
+    assert slow_queries.normalize("SELECT * FROM a WHERE b = 'x' AND c IN (1, 2, 3)") == \
+        'SELECT * FROM a WHERE b = ? AND c IN (?...)'
+
+
+@pytest.mark.django_db
+def test_rate_limit(client, user, plan, meals, settings, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('web_app.rate_limits.time', types.SimpleNamespace(time=lambda: now[0]))
+    settings.RATE_LIMITS = {'plan_meal_random_add': {'burst': 2, 'period': 60},
+                            'user_login': {'burst': 1, 'period': 60, 'methods': ('POST',)}}
+    client.force_login(user)
+    url = reverse('plan_meal_random_add', args=(plan.id,))
+    statuses = [client.get(url).status_code for _ in range(3)]
+    assert statuses[:2] == [302, 302]
+    assert statuses[2] == 429
+    assert client.get(url)['Retry-After'] == '30'
+    now[0] += 30
+    assert [client.get(url).status_code for _ in range(2)] == [302, 429]
+    client.logout()
+    login_url = reverse('user_login')
+    assert client.get(login_url).status_code == 200
+    assert client.post(login_url, {'username': 'x', 'password': 'y'}).status_code != 429
+    assert client.post(login_url, {'username': 'x', 'password': 'y'}).status_code == 429
+    assert client.get(login_url).status_code == 200
+    now[0] += 3600
+    assert rate_limits.remove_full_buckets() == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_rate_limit_concurrent_requests(monkeypatch):
+    m.RateLimitBucket.objects.create(key='concurrent', tokens=5, updated=time.time())
+    read = threading.Barrier(8)
+    # In-memory test database shared by threads fails on concurrent writes instead of waiting for them,
+    # so writes are done one by one, after every request has read the bucket.
+    writing = threading.Lock()
+    waited = threading.local()
+
+    def min_after_all_read(*args):
+        if not getattr(waited, 'done', False):
+            waited.done = True
+            read.wait(timeout=10)
+            writing.acquire()
+        return min(*args)
+
+    monkeypatch.setattr(rate_limits, 'min', min_after_all_read, raising=False)
+
+    def take():
+        try:
+            return rate_limits.take_token('concurrent', 5, 3600)
+        finally:
+            writing.release()
+            connection.close()
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: take(), range(8)))
+    assert results.count(None) == 5
+    assert m.RateLimitBucket.objects.get(key='concurrent').tokens < 1
+
+
+@pytest.mark.django_db
+def test_user_delete_in_background(client, user, plans, meals, monkeypatch):
+    monkeypatch.setattr('web_app.views.USER_DELETE_INLINE_LIMIT', 2)
+    cache.delete(m.SENTINEL_USER_CACHE_KEY)
+    client.force_login(user)
+    client.get(reverse('user_delete'))
+    user.refresh_from_db()
+    assert not user.is_active
+    assert client.get(reverse('user_favourite_meals')).status_code == 302
+    call_command('run_worker', once=True)
+    job = m.Job.objects.get(name='delete_user')
+    assert (job.status, job.progress, job.total) == ('done', 6, 6)
+    assert not User.objects.filter(id=user.id).exists()
+    sentinel = User.objects.get(username='deleted')
+    assert m.Plan.objects.filter(user=sentinel).count() == 3
+    assert m.Meal.objects.filter(user=sentinel).count() == 3
+    cache.delete(m.SENTINEL_USER_CACHE_KEY)
+
+
+@pytest.mark.django_db
+def test_plan_archive_and_restore(client, user, plans, meals, products):
+    plan, active_plan, favourite_plan = plans
+    plan.meal.set(meals)
+    m.PlanBoughtProduct.objects.create(plan=plan, product=products[0])
+    m.SelectedPlan.objects.create(user=user, active_plan=active_plan)
+    s.add_favourite_plan(user, favourite_plan.id)
+    m.Plan.objects.update(date_used=timezone.now() - timedelta(days=400))
+    output = io.StringIO()
+    call_command('archive_plans', days=365, stdout=output)
+    assert 'Zarchiwizowano 1 planów' in output.getvalue()
+    assert set(m.Plan.objects.values_list('id', flat=True)) == {active_plan.id, favourite_plan.id}
+    assert m.ArchivedPlanMeal.objects.count() == 3
+    assert not m.PlanMeal.objects.exists()
+    assert m.SelectedPlan.objects.get(user=user).active_plan_id == active_plan.id
+    assert not m.ChangeLog.objects.filter(model__in=('Plan', 'PlanMeal'), action='delete').exists()
+    assert m.ChangeLog.objects.filter(model='Plan', object_id=plan.id, action='archive').exists()
+    client.force_login(user)
+    assert 'plan zarchiwizowany' in client.get(reverse('user_plans')).content.decode()
+    get_response = client.get(reverse('plan_details', args=(plan.id,)))
+    assert get_response.status_code == 200
+    assert len(get_response.context['meals']) == 3
+    restored = m.Plan.objects.get(id=plan.id)
+    assert restored.date_created == plan.date_created
+    assert restored.date_used > timezone.now() - timedelta(days=1)
+    assert list(m.PlanBoughtProduct.objects.values_list('product_id', flat=True)) == [products[0].id]
+    assert not m.ArchivedPlan.objects.exists()
+    assert m.ChangeLog.objects.filter(model='Plan', object_id=plan.id, action='restore').exists()
+    assert client.get(reverse('plan_details', args=(12345,))).status_code == 404
+
+
+@pytest.mark.django_db
+def test_facet_filters(client, meals, products, producttypes):
+    cache.clear()
+    producttype1 = producttypes.get(name='testproducttype1')
+    m.Meal.objects.filter(name='testmeal3').update(type=3)
+    m.Product.objects.create(name='testproduct4', price=25, kcal=300, type=producttype1)
+    get_response = client.get(reverse('meals'), {'type': 3})
+    assert [meal.name for meal in get_response.context['meals']] == ['testmeal3']
+    assert 'Mięsne (2)' in get_response.content.decode()
+    assert 'Wegańskie (1)' in get_response.content.decode()
+    get_response = client.get(reverse('products'), {'price_min': '20', 'kcal_max': 'x'})
+    assert [product.name for product in get_response.context['products']] == ['testproduct4']
+    options = {option['label']: option['count'] for option in get_response.context['type_options']}
+    assert options['testproducttype'] == '0'
+    assert options['testproducttype1'] == '1'
+    with CaptureQueriesContext(connection) as queries:
+        client.get(reverse('products'), {'price_min': '20', 'kcal_max': 'x'})
+    assert not [query for query in queries if 'GROUP BY' in query['sql']]
+    m.Product.objects.create(name='testproduct5', price=30, kcal=300, type=producttype1)
+    get_response = client.get(reverse('products'), {'price_min': '20', 'type': producttype1.id})
+    assert len(get_response.context['products']) == 2
+    assert 'testproducttype1 (2)' in get_response.content.decode()
+    m.Plan.objects.create(name='testplan', user=meals[0].user, type=1, persons=1)
+    with CaptureQueriesContext(connection) as queries:
+        client.get(reverse('products'), {'price_min': '20', 'type': producttype1.id})
+    assert not [query for query in queries if 'GROUP BY' in query['sql']]
+
+
+@pytest.mark.django_db
+def test_autocomplete(client, user, meal, producttype):
+    m.Product.objects.create(name='Łosoś wędzony', price=30, kcal=200, type=producttype)
+    m.Product.objects.create(name='Jajka kurze', price=10, kcal=150, type=producttype)
+    url = reverse('autocomplete', args=('products',))
+    salmon = m.Product.objects.get(name='Łosoś wędzony')
+    assert client.get(url, {'q': 'losos'}).json()['results'] == [{'id': salmon.id, 'name': salmon.name,
+                                                                   'price': '30.00'}]
+    assert [item['name'] for item in client.get(url, {'q': 'KURZ'}).json()['results']] == ['Jajka kurze']
+    m.Product.objects.create(name='Kurczak', price=20, kcal=120, type=producttype)
+    assert [item['name'] for item in client.get(url, {'q': 'kur'}).json()['results']] == ['Kurczak', 'Jajka kurze']
+    m.Product.objects.create(name='Zupa kuracyjna', price=20, kcal=120, type=producttype)
+    assert [item['name'] for item in client.get(url, {'q': 'kur', 'limit': 1}).json()['results']] == ['Kurczak']
+    for limit in (-1, 0):
+        assert [item['name'] for item in client.get(url, {'q': 'kur', 'limit': limit}).json()['results']] == \
+            ['Kurczak']
+    for number in range(60):
+        m.Product.objects.create(name=f'Kurkuma {number}', price=5, kcal=300, type=producttype)
+    assert len(client.get(url, {'q': 'kur', 'limit': 1000}).json()['results']) == autocomplete.AUTOCOMPLETE_MAX_LIMIT
+    assert client.get(url, {'q': ''}).json()['results'] == []
+    meals_url = reverse('autocomplete', args=('meals',))
+    assert client.get(meals_url, {'q': 'test'}).json()['results'] == [{'id': meal.id, 'name': 'testmeal'}]
+    assert client.get(reverse('autocomplete', args=('users',))).status_code == 404
+    client.force_login(user)
+    content = client.get(reverse('meal_product_add', args=(meal.id,))).content.decode()
+    assert 'Jajka kurze' not in content
+    assert 'id="pickerInput"' in content
+
+
+@pytest.mark.django_db
+def test_meal_products_and_plan_meals_delta(client, user, group, plan, meal, meals, products):
+    client.force_login(user)
+    first, second, third = products
+    meal.product.add(first, second)
+    url = reverse('meal_products_delta', args=(meal.id,))
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post(url, {'add': [third.id, first.id, 99999], 'remove': [second.id]})
+    assert response.json() == {'added': 1, 'removed': 1}
+    assert len([query for query in queries if re.match(r'INSERT (OR IGNORE )?INTO "web_app_mealproduct"',
+                                                        query['sql'])]) == 1
+    assert len([query for query in queries if query['sql'].startswith('DELETE FROM "web_app_mealproduct"')]) == 1
+    assert set(meal.product.values_list('id', flat=True)) == {first.id, third.id}
+    assert set(m.ChangeLog.objects.filter(model='MealProduct').values_list('action', flat=True)) >= {'create',
+                                                                                                     'delete'}
+    plan_url = reverse('plan_meals_delta', args=(plan.id,))
+    assert client.post(plan_url, {'add': [meal.id for meal in meals]}).json() == {'added': 4, 'removed': 0}
+    assert client.post(plan_url, {'remove': [meal.id]}).json() == {'added': 0, 'removed': 1}
+    assert plan.meal.count() == 3
+    client.logout()
+    assert client.post(url, {'remove': [first.id]}).status_code == 302
+    other = User.objects.create(username='other')
+    other.groups.add(group)
+    client.force_login(other)
+    response = client.post(url, {'remove': [first.id]})
+    assert response.status_code == 403
+    assert response.json() == {'error': 'Nie możesz edytować czyjegoś dania.'}
+    assert meal.product.count() == 2
+
+
+@pytest.mark.django_db
+def test_meal_grams_bulk_set_view(client, user, meal, products):
+    client.force_login(user)
+    meal.product.add(*products)
+    rows = list(m.MealProduct.objects.filter(meal=meal).order_by('id'))
+    url = reverse('meal_grams_bulk', args=(meal.id,))
+    get_response = client.get(url)
+    assert len(get_response.context['form'].fields) == 3
+    data = {f'grams_{row.id}': 150 for row in rows}
+    data[f'grams_{rows[0].id}'] = -5
+    post_response = client.post(url, data)
+    assert post_response.status_code == 200
+    assert post_response.context['form'].errors
+    assert not m.MealProduct.objects.filter(grams=150).exists()
+    data[f'grams_{rows[0].id}'] = 0
+    with CaptureQueriesContext(connection) as queries:
+        post_response = client.post(url, data)
+    assert post_response.status_code == 302
+    assert len([query for query in queries if query['sql'].startswith('UPDATE "web_app_mealproduct"')]) == 1
+    assert sorted(m.MealProduct.objects.filter(meal=meal).values_list('grams', flat=True)) == [0, 150, 150]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_sentinel_user_id_cached_after_commit():
+    cache.delete(m.SENTINEL_USER_CACHE_KEY)
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            m.get_sentinel_user_id()
+            raise RuntimeError
+    assert cache.get(m.SENTINEL_USER_CACHE_KEY) is None
+    user_id = m.get_sentinel_user_id()
+    assert cache.get(m.SENTINEL_USER_CACHE_KEY) == user_id == User.objects.get(username='deleted').id
+    cache.delete(m.SENTINEL_USER_CACHE_KEY)
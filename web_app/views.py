@@ -1,12 +1,37 @@
+import io
+import json
+import pstats
 import random
+import re
+from pathlib import Path
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
-from django.contrib.auth.mixins import PermissionRequiredMixin
+from django.contrib.auth.mixins import PermissionRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.models import User, Group
 from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views import View
+from web_app import archive
+from web_app import autocomplete
+from web_app import changes
+from web_app import facets
+from web_app import jobs
+from web_app import metrics
 from web_app import models as m
 from web_app import forms as f
+from web_app import services as s
+from web_app import streaming
+
+PRODUCT_TYPE_DELETE_INLINE_LIMIT = 1000
+USER_DELETE_INLINE_LIMIT = 1000
+
+
+def posted_ids(request, name):
+    """
+    Function used to read set of ids posted in form field, values which are not numbers are skipped.
+    """
+    return {int(value) for value in request.POST.getlist(name) if value.isdigit()}
 
 
 class LoginView(View):
@@ -158,10 +183,16 @@ class UserDeleteView(PermissionRequiredMixin, View):
 
     def get(self, request):
         """
-        Deletes the user and redirects to main site.
+        Disables and logs out the user at once, then deletes the user and redirects to main site.
+        User with many plans and meals is deleted in background job.
         """
         user = request.user
-        user.delete()
+        s.disable_user(user)
+        logout(request)
+        if s.user_object_count(user) > USER_DELETE_INLINE_LIMIT:
+            jobs.enqueue('delete_user', user_id=user.id)
+        else:
+            s.delete_user(user.id)
         return redirect('base_view')
 
 
@@ -182,11 +213,15 @@ class PlanListView(View):
     def get(self, request):
         """
         Shows all plans as list with cost of each plan and 3 random plans on top.
+        Plans can be filtered by 'type' parameter, type select shows number of plans of each type.
         """
-        plans = m.Plan.objects.all().order_by('date_created')
+        plans, type_options, _ = facets.type_facet('plan_type', m.Plan, request)
+        plans = plans.order_by('date_created')
         random_plans = list(m.Plan.objects.all())
         random.shuffle(random_plans)
-        return render(request, 'plans.html', {'plans': plans, 'random_plans': random_plans})
+        return render(request, 'plans.html', {'plans': plans, 'random_plans': random_plans,
+                                              'type_options': type_options,
+                                              'favourite_plan_ids': s.favourite_plan_ids(request.user)})
 
 
 class PlanDetailsView(View):
@@ -197,9 +232,10 @@ class PlanDetailsView(View):
         """
         Shows specific plan details, such as cost, for how many persons, meals in plan.
         """
-        plan = get_object_or_404(m.Plan, id=plan_id)
+        plan = archive.get_plan_or_404(plan_id)
         meals = m.Meal.objects.filter(plan=plan_id)
-        return render(request, 'plan_details.html', {'plan': plan, 'meals': meals})
+        is_favourite = plan.id in s.favourite_plan_ids(request.user)
+        return render(request, 'plan_details.html', {'plan': plan, 'meals': meals, 'is_favourite': is_favourite})
 
 
 class PlanAddView(PermissionRequiredMixin, View):
@@ -249,7 +285,7 @@ class PlanModifyView(PermissionRequiredMixin, View):
         """
         Shows modify plan form filled with plan details.
         """
-        plan = get_object_or_404(m.Plan, id=plan_id)
+        plan = archive.get_plan_or_404(plan_id)
         user = request.user
         if user == plan.user:
             form = f.PlanAddForm(initial={'name': plan.name, 'type': plan.type,
@@ -263,7 +299,7 @@ class PlanModifyView(PermissionRequiredMixin, View):
         """
         Modifies plan details with given data and redirects to plan details site.
         """
-        plan = get_object_or_404(m.Plan, id=plan_id)
+        plan = archive.get_plan_or_404(plan_id)
         user = request.user
         if plan.user == user:
             form = f.PlanAddForm(request.POST)
@@ -290,7 +326,7 @@ class PlanDeleteView(PermissionRequiredMixin, View):
         """
         Shows warning if user really wants to delete the plan.
         """
-        plan = get_object_or_404(m.Plan, id=plan_id)
+        plan = archive.get_plan_or_404(plan_id)
         user = request.user
         if user == plan.user:
             return render(request, 'plan_delete.html', {'plan': plan})
@@ -303,7 +339,7 @@ class PlanDeleteView(PermissionRequiredMixin, View):
         If answer is yes, deletes the plan and redirects to all plans list site.
         Otherwise, redirects to plan's details site.
         """
-        plan = get_object_or_404(m.Plan, id=plan_id)
+        plan = archive.get_plan_or_404(plan_id)
         user = request.user
         if user == plan.user:
             if request.POST.get('answer') == 'Tak':
@@ -316,6 +352,34 @@ class PlanDeleteView(PermissionRequiredMixin, View):
         return render(request, 'plan_delete.html', {'msg': msg})
 
 
+class PlanCloneView(PermissionRequiredMixin, View):
+    """
+    Copies specific plan with all its meals as new plan of logged in user.
+    """
+    permission_required = 'web_app.add_plan'
+
+    def get(self, request, plan_id):
+        """
+        Shows clone plan form filled with plan details.
+        """
+        plan = archive.get_plan_or_404(plan_id)
+        form = f.PlanAddForm(initial={'name': plan.name, 'type': plan.type, 'persons': plan.persons})
+        return render(request, 'plan_add.html', {'form': form})
+
+    def post(self, request, plan_id):
+        """
+        Saves copy of the plan with given name, type and persons, redirects to new plan details site.
+        """
+        plan = archive.get_plan_or_404(plan_id)
+        form = f.PlanAddForm(request.POST)
+        if form.is_valid():
+            data = form.cleaned_data
+            new_plan = s.clone_plan(plan, request.user, name=data.get('name'),
+                                    type=data.get('type'), persons=data.get('persons'))
+            return redirect('plan_details', plan_id=new_plan.id)
+        return render(request, 'plan_add.html', {'form': form})
+
+
 class PlanMealAddView(PermissionRequiredMixin, View):
     """
     Ads meals to specific plan, with meal search option, only for logged in plan owner.
@@ -324,14 +388,15 @@ class PlanMealAddView(PermissionRequiredMixin, View):
 
     def get(self, request, plan_id):
         """
-        Shows add meals to specific plan form on screen.
+        Shows add meals to specific plan form on screen, other meals are found with autocomplete.
         """
         user = request.user
-        plan = get_object_or_404(m.Plan, id=plan_id)
+        plan = archive.get_plan_or_404(plan_id)
         if plan.user == user:
             chosen_meals = m.Meal.objects.filter(plan=plan_id)
-            meals = m.Meal.objects.exclude(plan=plan_id)
-            return render(request, 'plan_meal_add.html', {'plan': plan, 'meals': meals, 'chosen_meals': chosen_meals})
+            other_meals = m.Meal.objects.exclude(plan=plan_id).exists()
+            return render(request, 'plan_meal_add.html', {'plan': plan, 'other_meals': other_meals,
+                                                          'chosen_meals': chosen_meals})
         else:
             msg = 'Nie możesz edytować czyjegoś planu.'
             return render(request, 'plan_meal_add.html', {'msg': msg})
@@ -339,19 +404,37 @@ class PlanMealAddView(PermissionRequiredMixin, View):
     def post(self, request, plan_id):
         """
         Ads/removes chosen meal/meals to/from the plan and redirects to plan details site.
+        Only meals which were added or removed are saved.
         """
         user = request.user
-        plan = get_object_or_404(m.Plan, id=plan_id)
+        plan = archive.get_plan_or_404(plan_id)
         if plan.user == user:
-            meals = request.POST.getlist('meal')
-            plan.meal.set(meals)
-            plan.save()
+            meal_ids = posted_ids(request, 'meal')
+            chosen_meal_ids = set(m.PlanMeal.objects.filter(plan_id=plan.id).values_list('meal_id', flat=True))
+            s.update_plan_meals(plan, meal_ids - chosen_meal_ids, chosen_meal_ids - meal_ids)
             return redirect('plan_details', plan_id=plan_id)
         else:
             msg = 'Nie możesz edytować czyjegoś planu.'
             return render(request, 'plan_meal_add.html', {'msg': msg})
 
 
+class PlanMealDeltaView(PermissionRequiredMixin, View):
+    """
+    Ads and removes only given meals of specific plan, only for logged in plan owner.
+    """
+    permission_required = 'web_app.add_planmeal'
+
+    def post(self, request, plan_id):
+        """
+        Ads meals posted as 'add' and removes meals posted as 'remove', returns JSON with numbers of changes.
+        """
+        plan = archive.get_plan_or_404(plan_id)
+        if plan.user != request.user:
+            return JsonResponse({'error': 'Nie możesz edytować czyjegoś planu.'}, status=403)
+        added, removed = s.update_plan_meals(plan, posted_ids(request, 'add'), posted_ids(request, 'remove'))
+        return JsonResponse({'added': added, 'removed': removed})
+
+
 class PlanMealRandomAdd(PermissionRequiredMixin, View):
     """
     Ads random meal to specific plan, only for logged in plan creator.
@@ -363,14 +446,14 @@ class PlanMealRandomAdd(PermissionRequiredMixin, View):
         Gets one random meal and ads it to the plan, can be done until there are no meals left.
         """
         user = request.user
-        plan = get_object_or_404(m.Plan, id=plan_id)
+        plan = archive.get_plan_or_404(plan_id)
         if plan.user == user:
             meals = list(m.Meal.objects.all().exclude(plan=plan))
             random.shuffle(meals)
-            try:
-                m.PlanMeal.objects.create(plan_id=plan_id, meal_id=meals[0].id)
-            except IndexError:
-                pass
+            if meals:
+                added, _ = s.update_plan_meals(plan, [meals[0].id])
+                if added:
+                    metrics.inc('random_meals_added_total')
             return redirect('plan_meal_add', plan_id=plan_id)
         else:
             msg = 'Nie możesz edytować czyjegoś planu.'
@@ -384,11 +467,21 @@ class MealListView(View):
     def get(self, request):
         """
         Shows all meals as list with cost, kcal/100g of each meal and 3 random meals on top.
-        """
-        meals = m.Meal.objects.all().order_by('date_created')
+        Meals can be filtered by 'type' parameter, type select shows number of meals of each type.
+        With 'stream' parameter the list is streamed in chunks, for very large unpaginated output.
+        """
+        meals, type_options, _ = facets.type_facet('meal_type', m.Meal, request)
+        meals = meals.order_by('date_created')
+        favourite_meal_ids = s.favourite_meal_ids(request.user)
+        if request.GET.get('stream'):
+            random_meals = list(m.Meal.objects.order_by('?')[:3])
+            return streaming.stream_list(request, 'meals.html', {'random_meals': random_meals,
+                                                                 'type_options': type_options},
+                                         'meal_row.html', 'meal', meals, {'favourite_meal_ids': favourite_meal_ids})
         random_meals = list(m.Meal.objects.all())
         random.shuffle(random_meals)
-        return render(request, 'meals.html', {'meals': meals, 'random_meals': random_meals})
+        return render(request, 'meals.html', {'meals': meals, 'random_meals': random_meals,
+                                              'type_options': type_options, 'favourite_meal_ids': favourite_meal_ids})
 
 
 class MealDetailsView(View):
@@ -401,7 +494,10 @@ class MealDetailsView(View):
         """
         meal = get_object_or_404(m.Meal, id=meal_id)
         products = m.Product.objects.filter(meal=meal_id)
-        return render(request, 'meal_details.html', {'meal': meal, 'products': products})
+        similar_meals = m.SimilarMeal.objects.filter(meal=meal_id).select_related('similar')
+        is_favourite = meal.id in s.favourite_meal_ids(request.user)
+        return render(request, 'meal_details.html', {'meal': meal, 'products': products,
+                                                     'similar_meals': similar_meals, 'is_favourite': is_favourite})
 
 
 class MealAddView(PermissionRequiredMixin, View):
@@ -535,12 +631,11 @@ class MealPlanAddView(PermissionRequiredMixin, View):
 
     def post(self, request, meal_id):
         """
-        Ads/removes meal to/from chosen plan/plans and redirects to meal details site.
+        Ads meal to chosen plans of user and shows meal details site. Plans already holding the meal are skipped.
         """
         meal = get_object_or_404(m.Meal, id=meal_id)
-        plans = request.POST.getlist('plan')
-        for plan in plans:
-            m.PlanMeal.objects.create(plan_id=plan, meal_id=meal.id)
+        for plan in m.Plan.objects.filter(user=request.user, id__in=posted_ids(request, 'plan')):
+            s.update_plan_meals(plan, [meal.id])
         msg = 'Dodano danie do wybranego planu / ów.'
         products = m.Product.objects.filter(meal=meal_id)
         return render(request, 'meal_details.html', {'meal': meal, 'products': products, 'msg': msg})
@@ -554,17 +649,13 @@ class MealProductAddView(PermissionRequiredMixin, View):
 
     def get(self, request, meal_id):
         """
-        Shows add products to meal form on screen.
+        Shows add products to meal form on screen, other products are found with autocomplete.
         """
         user = request.user
         meal = get_object_or_404(m.Meal, id=meal_id)
         if meal.user == user:
             chosen_products = m.Product.objects.filter(meal=meal_id)
-            products = m.Product.objects.exclude(meal=meal_id)
-            product_types = m.ProductType.objects.all()
-            return render(request, 'meal_product_add.html', {'meal': meal, 'products': products,
-                                                             'chosen_products': chosen_products,
-                                                             'product_types': product_types})
+            return render(request, 'meal_product_add.html', {'meal': meal, 'chosen_products': chosen_products})
         else:
             msg = 'Nie możesz edytować czyjegoś dania.'
             return render(request, 'meal_product_add.html', {'msg': msg})
@@ -572,19 +663,37 @@ class MealProductAddView(PermissionRequiredMixin, View):
     def post(self, request, meal_id):
         """
         Ads/removes chosen product/products to/from the meal and redirects to meal details site.
+        Only products which were added or removed are saved.
         """
         user = request.user
         meal = get_object_or_404(m.Meal, id=meal_id)
         if meal.user == user:
-            products = request.POST.getlist('product')
-            meal.product.set(products)
-            meal.save()
+            product_ids = posted_ids(request, 'product')
+            chosen_product_ids = set(m.MealProduct.objects.filter(meal_id=meal.id).values_list('product_id', flat=True))
+            s.update_meal_products(meal, product_ids - chosen_product_ids, chosen_product_ids - product_ids)
             return redirect('meal_details', meal_id=meal_id)
         else:
             msg = 'Nie możesz edytować czyjegoś dania.'
             return render(request, 'meal_product_add.html', {'msg': msg})
 
 
+class MealProductDeltaView(PermissionRequiredMixin, View):
+    """
+    Ads and removes only given products of specific meal, only for logged in meal owner.
+    """
+    permission_required = 'web_app.add_mealproduct'
+
+    def post(self, request, meal_id):
+        """
+        Ads products posted as 'add' and removes products posted as 'remove', returns JSON with numbers of changes.
+        """
+        meal = get_object_or_404(m.Meal, id=meal_id)
+        if meal.user != request.user:
+            return JsonResponse({'error': 'Nie możesz edytować czyjegoś dania.'}, status=403)
+        added, removed = s.update_meal_products(meal, posted_ids(request, 'add'), posted_ids(request, 'remove'))
+        return JsonResponse({'added': added, 'removed': removed})
+
+
 class MealProductGramsSet(View):
     """
     Sets grammage of specific product in specific meal, only for logged in meal creator.
@@ -606,6 +715,43 @@ class MealProductGramsSet(View):
         return redirect('meal_details', meal_id=meal_id)
 
 
+class MealProductGramsBulkSet(PermissionRequiredMixin, View):
+    """
+    Sets grammage of all products in specific meal at once, only for logged in meal creator.
+    """
+    permission_required = 'web_app.change_mealproduct'
+
+    def meal_products(self, meal):
+        """
+        Gets products of meal with their names, in the order shown in the form.
+        """
+        return list(m.MealProduct.objects.filter(meal=meal).select_related('product').order_by('product__name', 'id'))
+
+    def get(self, request, meal_id):
+        """
+        Shows form with grammage of every product in meal.
+        """
+        meal = get_object_or_404(m.Meal, id=meal_id)
+        if meal.user != request.user:
+            return render(request, 'meal_grams_bulk_set.html', {'msg': 'Nie możesz edytować czyjegoś dania.'})
+        form = f.MealProductGramsForm(self.meal_products(meal))
+        return render(request, 'meal_grams_bulk_set.html', {'meal': meal, 'form': form})
+
+    def post(self, request, meal_id):
+        """
+        Validates and saves all given grammages at once and redirects to meal details site.
+        With wrong values shows the form again with errors and nothing is saved.
+        """
+        meal = get_object_or_404(m.Meal, id=meal_id)
+        if meal.user != request.user:
+            return render(request, 'meal_grams_bulk_set.html', {'msg': 'Nie możesz edytować czyjegoś dania.'})
+        form = f.MealProductGramsForm(self.meal_products(meal), request.POST)
+        if form.is_valid():
+            s.set_meal_grams(meal, form.grams())
+            return redirect('meal_details', meal_id=meal_id)
+        return render(request, 'meal_grams_bulk_set.html', {'meal': meal, 'form': form})
+
+
 class ProductListView(View):
     """
     Shows all products on screen with search option.
@@ -613,10 +759,16 @@ class ProductListView(View):
     def get(self, request):
         """
         Shows all products as list with price of each product.
+        Products can be filtered by 'type', 'price_min', 'price_max', 'kcal_min' and 'kcal_max' parameters,
+        type select shows number of products of each type within chosen ranges.
+        With 'stream' parameter the list is streamed in chunks, for very large unpaginated output.
         """
-        products = m.Product.objects.all().order_by('type')
-        product_types = m.ProductType.objects.all()
-        return render(request, 'products.html', {'products': products, 'product_types': product_types})
+        products, type_options, ranges = facets.product_facets(request)
+        products = products.order_by('type')
+        context = {'type_options': type_options, 'ranges': ranges}
+        if request.GET.get('stream'):
+            return streaming.stream_list(request, 'products.html', context, 'product_row.html', 'product', products)
+        return render(request, 'products.html', {'products': products, **context})
 
 
 class ProductDetailsView(View):
@@ -785,11 +937,15 @@ class ProductTypeDeleteView(PermissionRequiredMixin, View):
 
     def post(self, request, product_type_id):
         """
-        If answer is yes, deletes the product type. Always redirects to product types list site.
+        If answer is yes, deletes the product type, type with many products is deleted in background job.
+        Always redirects to product types list site.
         """
         product_type = m.ProductType.objects.get(id=product_type_id)
         if request.POST.get('answer') == 'Tak':
-            product_type.delete()
+            if product_type.product_set.count() > PRODUCT_TYPE_DELETE_INLINE_LIMIT:
+                jobs.enqueue('delete_product_type', product_type_id=product_type.id)
+            else:
+                product_type.delete()
         return redirect('product_types')
 
 
@@ -799,12 +955,13 @@ class UserPlanListView(View):
     """
     def get(self, request):
         """
-        Shows plans created by user as list with cost of each plan.
+        Shows plans created by user as list with cost of each plan, archived plans are listed without cost.
         """
         user = request.user
         try:
             user_plans = m.Plan.objects.filter(user=user)
-            return render(request, 'user_plans.html', {'user_plans': user_plans})
+            archived_plans = m.ArchivedPlan.objects.filter(user=user)
+            return render(request, 'user_plans.html', {'user_plans': user_plans, 'archived_plans': archived_plans})
         except TypeError:
             return redirect('login')
 
@@ -834,12 +991,7 @@ class UserFavouritePlanAddView(PermissionRequiredMixin, View):
         """
         Saves plan as user's favourite, redirects to this plan details site, only for logged in user.
         """
-        user = request.user
-        try:
-            favourite_plans = m.FavouritePlan.objects.get(user=user)
-        except ObjectDoesNotExist:
-            favourite_plans= m.FavouritePlan.objects.create(user=user)
-        favourite_plans.plan.add(plan_id)
+        s.add_favourite_plan(request.user, plan_id)
         return redirect('plan_details', plan_id=plan_id)
 
 
@@ -854,9 +1006,7 @@ class UserFavouritePlanDeleteView(PermissionRequiredMixin, View):
         Removes plan from user's favourite plans, redirects to user's favourite plans site,
         only for logged in user.
         """
-        user = request.user
-        favourite_plans = m.FavouritePlan.objects.get(user=user)
-        favourite_plans.plan.remove(plan_id)
+        s.remove_favourite_plan(request.user, plan_id)
         return redirect('user_favourite_plans')
 
 
@@ -901,13 +1051,7 @@ class UserFavouriteMealAddView(PermissionRequiredMixin, View):
         """
         Saves meal as user's favourite, redirects to this meal details site, only for logged in user.
         """
-        user = request.user
-        try:
-            favourite_meals = m.FavouriteMeal.objects.get(user=user)
-        except ObjectDoesNotExist:
-            m.FavouriteMeal.objects.create(user=user)
-            favourite_meals = m.FavouriteMeal.objects.get(user=user)
-        favourite_meals.meal.add(meal_id)
+        s.add_favourite_meal(request.user, meal_id)
         return redirect('meal_details', meal_id=meal_id)
 
 
@@ -922,9 +1066,7 @@ class UserFavouriteMealDeleteView(PermissionRequiredMixin, View):
         Removes meal from user's favourite meals, redirects to user's favourite meals site,
         only for logged in user.
         """
-        user = request.user
-        favourite_meals = m.FavouriteMeal.objects.get(user=user)
-        favourite_meals.meal.remove(meal_id)
+        s.remove_favourite_meal(request.user, meal_id)
         return redirect('user_favourite_meals')
 
 
@@ -959,7 +1101,7 @@ class UserSelectedPlanAddView(PermissionRequiredMixin, View):
         """
         Shows warning if user really wants to set the plan as an active plan.
         """
-        plan = m.Plan.objects.get(id=plan_id)
+        plan = archive.get_plan_or_404(plan_id)
         return render(request, 'user_selected_plan_add.html', {'plan': plan})
 
     def post(self, request, plan_id):
@@ -980,31 +1122,183 @@ class UserSelectedPlanAddView(PermissionRequiredMixin, View):
             return redirect('plan_details', plan_id=plan_id)
 
 
-def products_sort(product):
-    """
-    Function used to sort products first by type, then by name.
-    """
-    return product.type.name
-
-
 class PlanProductListView(View):
     """
     Shows list of products from all meals included in specified plan.
     """
     def get(self, request, plan_id):
         """
-        Show interactive list of products needed for the plan. List is made of two tables: 'Yet to buy'
-        and 'Already bought'.
+        Show interactive list of products needed for the plan, in whole packages for all plan persons.
+        List is made of two tables: 'Yet to buy' and 'Already bought', bought products are read from saved
+        state of the list.
         """
-        plan = m.Plan.objects.get(id=plan_id)
+        plan = archive.get_plan_or_404(plan_id)
         meals = m.Meal.objects.filter(plan=plan)
-        products_list = []
-        cost = 0
-        for meal in meals:
-            products = m.Product.objects.filter(meal=meal)
-            for product in products:
-                products_list.append(product)
-                cost += product.price
-        products_list.sort(key=products_sort)
+        products_list, cost = s.shopping_list(plan)
+        bought_product_ids = set(m.PlanBoughtProduct.objects.filter(plan=plan).values_list('product_id', flat=True))
         return render(request, 'plan_product_list.html', {'plan': plan, 'meals': meals,
-                                                          'products': products_list, 'cost': cost})
+                                                          'products': products_list, 'cost': cost,
+                                                          'bought_product_ids': bought_product_ids})
+
+
+class PlansProductListView(View):
+    """
+    Shows one list of products from all meals of many plans.
+    """
+    def get(self, request):
+        """
+        Shows products needed for plans given as 'plan' parameters, together with user's favourite plans
+        if 'favourites' parameter is given and user's active plan if 'active' parameter is given.
+        """
+        plan_ids = {int(plan_id) for plan_id in request.GET.getlist('plan') if plan_id.isdigit()}
+        if request.GET.get('favourites'):
+            plan_ids |= s.favourite_plan_ids(request.user)
+        if request.GET.get('active') and request.user.is_authenticated:
+            plan_ids |= set(m.SelectedPlan.objects.filter(user=request.user, active_plan__isnull=False)
+                            .values_list('active_plan_id', flat=True))
+        plans = m.Plan.objects.filter(id__in=plan_ids).order_by('name')
+        products, cost = s.plans_shopping_list(plan_ids)
+        return render(request, 'plans_product_list.html', {'plans': plans, 'products': products, 'cost': cost})
+
+
+class PlanBoughtProductView(PermissionRequiredMixin, View):
+    """
+    Saves whether product from plan's shopping list is already bought, only for logged in plan owner.
+    """
+    permission_required = 'web_app.view_plan'
+
+    def post(self, request, plan_id, product_id):
+        """
+        Marks product as bought or not bought, according to JSON body {"bought": true/false}.
+        Only products from plan's shopping list can be marked as bought. Returns empty response.
+        """
+        plan = archive.get_plan_or_404(plan_id)
+        if plan.user != request.user:
+            return HttpResponseForbidden('Nie możesz edytować czyjegoś planu.')
+        product = get_object_or_404(m.Product, id=product_id)
+        try:
+            bought = bool(json.loads(request.body or '{}').get('bought', True))
+        except (ValueError, AttributeError):
+            return HttpResponseBadRequest()
+        if bought and not m.Product.objects.filter(id=product.id, mealproduct__meal__planmeal__plan=plan).exists():
+            return HttpResponseBadRequest('Produktu nie ma na liście zakupów planu.')
+        if bought:
+            m.PlanBoughtProduct.objects.get_or_create(plan=plan, product_id=product_id)
+        else:
+            m.PlanBoughtProduct.objects.filter(plan=plan, product_id=product_id).delete()
+        return HttpResponse(status=204)
+
+
+class PlanProductListSyncView(View):
+    """
+    Sends changes of plan's shopping list, used by offline shopping list.
+    """
+    def get(self, request, plan_id):
+        """
+        Returns JSON with products added, changed or removed since 'version' token and new version token.
+        Without token, or with expired one, whole list is returned.
+        """
+        plan = archive.get_plan_or_404(plan_id)
+        return JsonResponse(s.shopping_list_delta(plan, request.GET.get('version')))
+
+
+class ServiceWorkerView(View):
+    """
+    Serves service worker script from main site, so it can cache shopping lists for offline use.
+    """
+    def get(self, request):
+        """
+        Returns service worker script.
+        """
+        response = render(request, 'sw.js', content_type='application/javascript')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+class ChangeFeedView(View):
+    """
+    Sends catalog changes for incremental synchronization of other services.
+    """
+    def get(self, request):
+        """
+        Returns JSON with changes newer than 'since' cursor, at most 'limit' of them, and cursor of next page.
+        """
+        try:
+            since = int(request.GET.get('since', 0))
+            limit = max(1, min(int(request.GET.get('limit', changes.CHANGE_FEED_LIMIT)), changes.CHANGE_FEED_LIMIT))
+        except ValueError:
+            return HttpResponseBadRequest()
+        return JsonResponse(changes.changes_since(since, limit))
+
+
+class AutocompleteView(View):
+    """
+    Suggests products or meals matching text typed in pickers.
+    """
+    def get(self, request, kind):
+        """
+        Returns JSON with products or meals with any word of name starting with 'q', at most 'limit' of them.
+        """
+        if kind not in autocomplete.SOURCES:
+            raise Http404
+        try:
+            limit = max(1, min(int(request.GET.get('limit', autocomplete.AUTOCOMPLETE_LIMIT)),
+                               autocomplete.AUTOCOMPLETE_MAX_LIMIT))
+        except ValueError:
+            return HttpResponseBadRequest()
+        return JsonResponse({'results': autocomplete.search(kind, request.GET.get('q', ''), limit)})
+
+
+class JobStatusView(PermissionRequiredMixin, View):
+    """
+    Shows state of background job.
+    """
+    permission_required = 'web_app.view_job'
+
+    def get(self, request, job_id):
+        """
+        Returns JSON with job status, progress and result.
+        """
+        job = get_object_or_404(m.Job, id=job_id)
+        return JsonResponse({'id': job.id, 'name': job.name, 'status': job.status, 'attempts': job.attempts,
+                             'progress': job.progress, 'total': job.total, 'result': job.result})
+
+
+class ProfileDetailsView(UserPassesTestMixin, View):
+    """
+    Shows saved request profile, only for staff users.
+    """
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, name):
+        """
+        Shows functions of profiled request sorted by cumulative time, template filters and tags
+        with their callers and call tree of the slowest functions.
+        """
+        path = Path(settings.PROFILE_DIR) / f'{name}.prof'
+        if not re.fullmatch(r'[\w-]+', name) or not path.exists():
+            raise Http404
+        sections = []
+        for title, method, restriction in (('Najwolniejsze funkcje', 'print_stats', 40),
+                                           ('Filtry i tagi szablonów', 'print_callers', 'templatetags'),
+                                           ('Drzewo wywołań', 'print_callees', 20)):
+            output = io.StringIO()
+            stats = pstats.Stats(str(path), stream=output)
+            # Template filters and tags are found by their module directory, so directories are kept there.
+            if restriction != 'templatetags':
+                stats.strip_dirs()
+            getattr(stats.sort_stats('cumulative'), method)(restriction)
+            sections.append((title, output.getvalue()))
+        return render(request, 'profile_details.html', {'name': name, 'sections': sections})
+
+
+class MetricsView(View):
+    """
+    Shows application metrics of all worker processes in Prometheus text format.
+    """
+    def get(self, request):
+        """
+        Returns metrics of requests, database queries, cache, active users and domain events.
+        """
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')